@@ -0,0 +1,105 @@
+"""Time every extractor over saved listing pages.
+
+Pages are read from --dir (*.html); --save N first downloads listing
+pages 1..N of --item there. Each extractor must return the same URLs
+as xpath; the fastest one that agrees is the EXTRACTOR to configure.
+"""
+import argparse
+import glob
+import os
+import time
+
+import requests
+from loguru import logger
+
+from discovery import parse_items
+from extractors import EXTRACTORS
+from settings import config
+
+
+def save_pages(directory: str, url: str, item: str, pages: int) -> None:
+    os.makedirs(directory, exist_ok=True)
+    with requests.Session() as session:
+        for page in range(1, pages + 1):
+            response = session.get(f'{url}p{page}/{item}.html')
+            response.raise_for_status()
+            with open(os.path.join(directory, f'{item}-{page}.html'),
+                      'wb') as f:
+                f.write(response.content)
+
+
+def load_pages(directory: str, raw: bool) -> list:
+    documents = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.html'))):
+        with open(path, 'rb') as f:
+            data = f.read()
+        documents.append(data if raw else data.decode('utf-8', 'replace'))
+    return documents
+
+
+def measure(extract, documents: list, image_host: str,
+            repeat: int) -> float:
+    """Best of `repeat` passes, seconds per page."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for document in documents:
+            extract(document, image_host)
+        best = min(best, time.perf_counter() - start)
+    return best / len(documents)
+
+
+def parse_cli_args():
+    mparser = argparse.ArgumentParser(
+        description='Benchmark image URL extractors on saved listing pages')
+    mparser.add_argument('--dir',
+                         default='listings',
+                         help='directory with saved *.html listing pages')
+    mparser.add_argument('--save',
+                         type=int,
+                         default=0,
+                         help='download this many listing pages first')
+    mparser.add_argument('--url', default=config['SCRAPER']['URL'])
+    mparser.add_argument('--item',
+                         default=parse_items(config['SCRAPER']['ITEM'])[0])
+    mparser.add_argument('--image-host',
+                         default=config['SCRAPER']['IMAGE_HOST'])
+    mparser.add_argument('--repeat', type=int, default=20)
+    mparser.add_argument('--raw',
+                         action='store_true',
+                         help='feed bytes instead of decoded text')
+    return mparser.parse_args()
+
+
+def main():
+    args = parse_cli_args()
+    if args.save:
+        save_pages(args.dir, args.url, args.item, args.save)
+    documents = load_pages(args.dir, args.raw)
+    if not documents:
+        raise SystemExit(f'no *.html pages in {args.dir}, try --save 10')
+
+    expected = [
+        EXTRACTORS['xpath'](document, args.image_host)
+        for document in documents
+    ]
+    logger.info(
+        f'{len(documents)} pages, '
+        f'{sum(map(len, expected)) / len(documents):.1f} images/page'
+    )
+    timings = {}
+    for name, extract in EXTRACTORS.items():
+        agrees = all(
+            extract(document, args.image_host) == urls
+            for document, urls in zip(documents, expected)
+        )
+        per_page = measure(extract, documents, args.image_host, args.repeat)
+        if agrees:
+            timings[name] = per_page
+        print(f'{name:>6}: {per_page * 1e6:8.1f}us/page'
+              f'{"" if agrees else "  (differs from xpath)"}')
+    print(f'EXTRACTOR: {min(timings, key=timings.get)}')
+
+
+if __name__ == '__main__':
+    main()
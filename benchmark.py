@@ -0,0 +1,200 @@
+"""Sweep modes, process counts and concurrency against the mock site.
+
+Every combination runs image_scraper.py in a fresh interpreter with
+--report and the results are collected into a markdown table, along
+with the time from launch to the first page and image request the mock
+site saw, which is where import and pool startup costs show up.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from loguru import logger
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+COLUMNS = (
+    ('mode', '{}'),
+    ('loop', '{}'),
+    ('eager', '{}'),
+    ('processes', '{}'),
+    ('concurrency', '{}'),
+    ('elapsed', '{:.2f}s'),
+    ('first_request', '{:.3f}s'),
+    ('first_image', '{:.3f}s'),
+    ('images_per_second', '{:.1f}'),
+    ('mb_per_second', '{:.2f}'),
+    ('latency_avg', '{:.3f}s'),
+    ('latency_max', '{:.3f}s'),
+    ('failed', '{}'),
+)
+EAGER = {'on': [True], 'off': [False], 'both': [False, True]}
+
+
+def int_list(value: str) -> list:
+    return [int(part) for part in value.split(',')]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f'mock site did not start on port {port}')
+
+
+def start_site(args, port: int) -> subprocess.Popen:
+    site = subprocess.Popen([
+        sys.executable, os.path.join(HERE, 'mock_site.py'),
+        '--port', str(port),
+        '--pages', str(args.pages),
+        '--images-per-page', str(args.images_per_page),
+        '--image-size', str(args.image_size),
+        '--latency', str(args.latency),
+        '--bandwidth', str(args.bandwidth),
+        '--error-rate', str(args.error_rate),
+    ])
+    wait_for_port(port)
+    return site
+
+
+def site_stats(port: int, action: str = '') -> dict:
+    request = urllib.request.Request(
+        f'http://127.0.0.1:{port}/_stats{action}',
+        method='POST' if action else 'GET'
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+def run_scraper(args, port: int, mode: str, processes: int,
+                concurrency: int, loop: str, eager: bool) -> dict:
+    with tempfile.TemporaryDirectory() as out_dir:
+        report = os.path.join(out_dir, 'report.json')
+        site_stats(port, '/reset')
+        launched = time.time()
+        subprocess.run([
+            sys.executable, os.path.join(HERE, 'image_scraper.py'),
+            '--url', f'http://127.0.0.1:{port}/',
+            '--image-host', f'127.0.0.1:{port}/img/',
+            '--item', 'bench',
+            '--pages', str(args.pages),
+            '--out-dir', os.path.join(out_dir, 'images'),
+            '--report', report,
+            '--no-http-cache',
+            '--discovery-ttl', '0',
+            '-m', mode,
+            '-p', str(processes),
+            '-c', str(concurrency),
+            '--loop', loop,
+            '--eager' if eager else '--no-eager',
+        ], check=True, cwd=HERE, stderr=subprocess.DEVNULL)
+        first = site_stats(port)
+        with open(report) as f:
+            row = json.load(f)
+        for column, kind in (('first_request', 'page'),
+                             ('first_image', 'image')):
+            seen = first[kind]
+            row[column] = seen - launched if seen else float('nan')
+        return row
+
+
+def table(rows: list) -> str:
+    lines = [
+        '| ' + ' | '.join(name for name, _ in COLUMNS) + ' |',
+        '|' + '---|' * len(COLUMNS),
+    ]
+    for row in rows:
+        lines.append('| ' + ' | '.join(
+            fmt.format(row[name]) for name, fmt in COLUMNS
+        ) + ' |')
+    return '\n'.join(lines)
+
+
+def parse_cli_args():
+    mparser = argparse.ArgumentParser(
+        description='Benchmark sync vs async against a local mock site')
+    mparser.add_argument('--modes',
+                         default='sync,threads,async',
+                         help='comma separated --mode values')
+    mparser.add_argument('--processes',
+                         type=int_list,
+                         default=[1, 2, 4],
+                         help='comma separated --process values')
+    mparser.add_argument('--concurrency',
+                         type=int_list,
+                         default=[8, 32],
+                         help='comma separated --concurrency values for '
+                              'threads and async modes')
+    mparser.add_argument('--loops',
+                         default='asyncio',
+                         help='comma separated --loop values for async mode')
+    mparser.add_argument('--eager',
+                         default='on',
+                         choices=['on', 'off', 'both'],
+                         help='eager task factory setting(s) for async mode')
+    mparser.add_argument('--pages', type=int, default=10)
+    mparser.add_argument('--images-per-page', type=int, default=30)
+    mparser.add_argument('--image-size', type=int, default=64 * 1024)
+    mparser.add_argument('--latency', type=float, default=0.05)
+    mparser.add_argument('--bandwidth', type=int, default=0)
+    mparser.add_argument('--error-rate', type=float, default=0.0)
+    mparser.add_argument('--output',
+                         default='benchmark.md',
+                         help='markdown file the table is written to')
+    return mparser.parse_args()
+
+
+def main():
+    args = parse_cli_args()
+    eagers = EAGER[args.eager]
+    if True in eagers and not hasattr(asyncio, 'eager_task_factory'):
+        logger.warning('eager task factory needs Python 3.12+, skipping')
+        eagers = [False]
+    port = free_port()
+    site = start_site(args, port)
+    rows = []
+    try:
+        for mode, processes in itertools.product(
+                args.modes.split(','), args.processes
+        ):
+            concurrencies = args.concurrency if mode != 'sync' else [1]
+            loops = args.loops.split(',') if mode == 'async' else ['asyncio']
+            for concurrency, loop, eager in itertools.product(
+                    concurrencies, loops,
+                    eagers if mode == 'async' else [False]
+            ):
+                logger.info(
+                    f'Running {mode} p={processes} c={concurrency} '
+                    f'loop={loop} eager={eager}'
+                )
+                rows.append(run_scraper(
+                    args, port, mode, processes, concurrency, loop, eager
+                ))
+    finally:
+        site.terminate()
+        site.wait()
+    result = table(rows)
+    print(result)
+    with open(args.output, 'w') as f:
+        f.write(result + '\n')
+
+
+if __name__ == '__main__':
+    main()
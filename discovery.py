@@ -0,0 +1,191 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+from loguru import logger
+
+from retry import RetryableStatus, RetryPolicy, parse_retry_after
+
+
+class Page(NamedTuple):
+    """Listing page `number` of `item`, crawled for daemon job `job`."""
+    item: str
+    number: int
+    job: int = 0
+
+    def __str__(self):
+        return f'{self.item}/{self.number}'
+
+
+class PageTask(NamedTuple):
+    """A page on task_queue; `image_urls` is set when already parsed."""
+    page: Page
+    image_urls: Optional[tuple] = None
+
+
+class Discovery(NamedTuple):
+    pages: int
+    image_urls: tuple
+    rtt: float
+    parse_cost: float
+
+
+class DiscoveryCache:
+    """Page 1 of each (URL, ITEM) as discovered by earlier runs.
+
+    One JSON file maps `<url> <item>` to the page count and the parsed
+    image list of page 1; entries older than `ttl` seconds are ignored.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self.entries = None
+        self.lock = threading.Lock()
+
+    def load(self) -> dict:
+        if self.entries is None:
+            try:
+                with open(self.path) as f:
+                    self.entries = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self.entries = {}
+        return self.entries
+
+    def get(self, url: str, item: str, image_host: str):
+        if self.ttl <= 0:
+            return None
+        entry = self.load().get(f'{url} {item}')
+        if (entry is None or entry['image_host'] != image_host
+                or time.time() - entry['time'] > self.ttl):
+            return None
+        return Discovery(entry['pages'], tuple(entry['image_urls']),
+                         entry['rtt'], entry['parse_cost'])
+
+    def store(self, url: str, image_host: str, discoveries: dict) -> None:
+        """Save {item: Discovery} in one write."""
+        if self.ttl <= 0 or not discoveries:
+            return
+        with self.lock:
+            entries = self.load()
+            now = time.time()
+            for item, discovery in discoveries.items():
+                entries[f'{url} {item}'] = {
+                    'time': now,
+                    'image_host': image_host,
+                    **discovery._asdict(),
+                }
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+
+
+def fetch_first_page(url: str, retry_policy: RetryPolicy,
+                     timeout: float) -> tuple:
+    """(text, seconds to the response headers) of `url`.
+
+    Plain urllib, so the parent process never imports requests or
+    aiohttp whichever mode the workers run in.
+    """
+    from http.client import HTTPException
+    from urllib.error import HTTPError
+    from urllib.request import urlopen
+
+    attempt = 0
+    while True:
+        started = time.perf_counter()
+        try:
+            with urlopen(url, timeout=timeout) as response:
+                rtt = time.perf_counter() - started
+                charset = response.headers.get_content_charset('utf-8')
+                return response.read().decode(charset, 'replace'), rtt
+        except HTTPError as exc:
+            if not retry_policy.retryable(exc.code):
+                raise
+            error = RetryableStatus(
+                exc.code, parse_retry_after(exc.headers.get('Retry-After'))
+            )
+        except (OSError, HTTPException) as exc:
+            error = exc
+        if attempt + 1 >= retry_policy.attempts:
+            raise error
+        delay = retry_policy.delay(
+            attempt, getattr(error, 'retry_after', None)
+        )
+        logger.warning(f'{url} {error!r}, retry {attempt + 1} '
+                       f'in {delay:.2f}s')
+        attempt += 1
+        time.sleep(delay)
+
+
+def discover(url: str, item: str, image_host: str, extract,
+             retry_policy: RetryPolicy, timeout: float) -> Discovery:
+    """Fetch page 1 of `item` for its page count and image URLs."""
+    from lxml import etree
+
+    page_url = f'{url}p1/{item}.html'
+    text, rtt = fetch_first_page(page_url, retry_policy, timeout)
+    tree = etree.HTML(text)
+    pagination = [] if tree is None else tree.xpath(
+        '//li[@class="pag-text"]/text()'
+    )
+    if not pagination:
+        raise ValueError(f'{page_url} has no page count')
+    pages = int(pagination[0].split()[1])
+    start = time.thread_time()
+    image_urls = tuple(extract(text, image_host))
+    return Discovery(pages, image_urls, rtt, time.thread_time() - start)
+
+
+def discover_all(url: str, items: list, image_host: str, extract,
+                 cache: DiscoveryCache, workers: int,
+                 retry_policy: RetryPolicy, timeout: float) -> dict:
+    """{item: Discovery}, from the cache or fetched `workers` at a time.
+
+    A category whose page 1 cannot be fetched or read is logged and
+    left out.
+    """
+    def attempt(item: str):
+        try:
+            return discover(url, item, image_host, extract, retry_policy,
+                            timeout)
+        except Exception as exc:
+            logger.error(f'Category {item} skipped, {exc!r}')
+            return None
+
+    discoveries = {item: cache.get(url, item, image_host) for item in items}
+    missing = [item for item, found in discoveries.items() if found is None]
+    if missing:
+        with ThreadPoolExecutor(min(workers, len(missing))) as executor:
+            fetched = dict(zip(missing, executor.map(attempt, missing)))
+        fetched = {
+            item: found for item, found in fetched.items()
+            if found is not None
+        }
+        cache.store(url, image_host, fetched)
+        discoveries.update(fetched)
+    return {
+        item: found for item, found in discoveries.items()
+        if found is not None
+    }
+
+
+def parse_items(value) -> list:
+    """Categories from a YAML list or a comma separated string."""
+    if isinstance(value, str):
+        value = value.split(',')
+    return [item.strip() for item in value if item.strip()]
+
+
+def read_items(path: str) -> list:
+    """Categories from a file, one per line; blanks and # comments skipped."""
+    with open(path) as f:
+        return [
+            line.strip() for line in f
+            if line.strip() and not line.startswith('#')
+        ]
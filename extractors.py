@@ -0,0 +1,78 @@
+"""Image URL extractors for listing pages.
+
+Every extractor takes the page (str or bytes) and the image host and
+returns the matching `img/@src` values in document order. They are
+plain module-level functions so a process pool can pickle them. lxml
+is only imported by the extractors that use it.
+"""
+import functools
+import re
+from html import unescape
+
+CHUNK_SIZE = 16384
+# src, not data-src; the value double, single or un-quoted.
+IMG_TAG = re.compile(
+    r'<img\b[^>]*?(?<![\w-])src\s*=\s*'
+    r'(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'>]+))',
+    re.IGNORECASE
+)
+IMG_TAG_BYTES = re.compile(IMG_TAG.pattern.encode(), re.IGNORECASE)
+
+
+@functools.cache
+def img_src():
+    from lxml import etree
+
+    return etree.XPath('//img/@src[contains(., $host)]', smart_strings=False)
+
+
+def xpath(document, image_host: str) -> list:
+    """Whole-document parse with a precompiled, host-filtered XPath."""
+    from lxml import etree
+
+    tree = etree.HTML(document)
+    if tree is None:
+        return []
+    return img_src()(tree, host=image_host)
+
+
+def pull(document, image_host: str) -> list:
+    """Incremental parse that stops at the pagination after the grid."""
+    from lxml import etree
+
+    parser = etree.HTMLPullParser(events=('start',), tag=('img', 'li'))
+    image_urls = []
+    for offset in range(0, len(document), CHUNK_SIZE):
+        parser.feed(document[offset:offset + CHUNK_SIZE])
+        for _, element in parser.read_events():
+            if element.tag == 'img':
+                src = element.get('src')
+                if src and image_host in src:
+                    image_urls.append(src)
+            elif image_urls and element.get('class') == 'pag-text':
+                return image_urls
+    parser.close()
+    return image_urls
+
+
+def regex(document, image_host: str) -> list:
+    """Regex over the raw markup, no tree at all."""
+    if isinstance(document, bytes):
+        host = image_host.encode()
+        return [
+            unescape(src.decode())
+            for src in map(b''.join, IMG_TAG_BYTES.findall(document))
+            if host in src
+        ]
+    return [
+        unescape(src) if '&' in src else src
+        for src in map(''.join, IMG_TAG.findall(document))
+        if image_host in src
+    ]
+
+
+EXTRACTORS = {
+    'xpath': xpath,
+    'pull': pull,
+    'regex': regex,
+}
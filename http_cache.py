@@ -0,0 +1,69 @@
+import hashlib
+import itertools
+import json
+import os
+
+from storage import ShardDirs, shard_path
+
+
+class ValidatorCache:
+    """On-disk ETag/Last-Modified store keyed by URL.
+
+    Listing pages keep their body next to the validators so a 304 can be
+    answered from disk; images only keep the validators, the file in
+    OUT_DIR is the cached copy. Entries are sharded by their hash like
+    a sharded OUT_DIR, and safe to store from several threads.
+    """
+
+    def __init__(self, directory: str, levels: int = 2, width: int = 2):
+        self.directory = directory
+        self.levels = levels
+        self.width = width
+        self.hits = 0
+        self.misses = 0
+        self.dirs = ShardDirs()
+        self.temp_names = itertools.count()
+        os.makedirs(directory, exist_ok=True)
+
+    def entry_path(self, url: str) -> str:
+        digest = hashlib.sha1(url.encode()).hexdigest()
+        return shard_path(
+            self.directory, f'{digest}.json', self.levels, self.width
+        )
+
+    def load(self, url: str) -> dict:
+        try:
+            with open(self.entry_path(url)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def headers(self, url: str) -> dict:
+        entry = self.load(url)
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def body(self, url: str):
+        return self.load(url).get('body')
+
+    def store(self, url: str, headers, body: str = None) -> None:
+        self.misses += 1
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        path = self.dirs.ensure(self.entry_path(url))
+        tmp_path = f'{path}.{os.getpid()}-{next(self.temp_names)}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(
+                {'etag': etag, 'last_modified': last_modified, 'body': body},
+                f
+            )
+        os.replace(tmp_path, path)
+
+    def __str__(self):
+        return f'http cache hits={self.hits} misses={self.misses}'
@@ -1,119 +1,1107 @@
+from __future__ import annotations
+
 import argparse
 import asyncio
+import functools
+import importlib.util
+import json
+import math
 import multiprocessing
-import shutil
+import os
+import queue
+import signal
+import statistics
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import (ALL_COMPLETED, FIRST_COMPLETED,
+                                ProcessPoolExecutor, ThreadPoolExecutor, wait)
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
 
-import aiofiles
-import requests
-from aiohttp import ClientSession
 from loguru import logger
-from lxml import html
 
+from discovery import (DiscoveryCache, Page, PageTask, discover_all,
+                       parse_items, read_items)
+from extractors import EXTRACTORS
+from http_cache import ValidatorCache
+from limiter import AdaptiveLimiter
+from manifest import Manifest
+from progress import (BYTES, FAILURES, IMAGES, INFLIGHT, PAGES, Progress,
+                      ProgressReport)
+from rate_limit import SharedTokenBucket
+from results import (CACHED, FAILED, PAGE_DONE, PAGE_FAILED, SKIPPED,
+                     SUCCEEDED, ResultBatch, Summary)
+from retry import RetryableStatus, RetryBudget, RetryPolicy, parse_retry_after
 from settings import config
+from storage import ContentStore, Layout
+from writer import FSYNC, FileWriter
+
+# The HTTP clients are imported by the mode that uses them: sync and
+# threads workers never load aiohttp, async workers never load requests.
+if TYPE_CHECKING:
+    import requests
+    from aiohttp import ClientSession, TraceConfig
+
+    from service import Job
+
+PARSERS = {
+    'inline': None,
+    'thread': ThreadPoolExecutor,
+    'process': ProcessPoolExecutor,
+}
+
+
+class LoopMonitor:
+    """Tracks how long the event loop was blocked past its wake-up time."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self.parse_time = 0.0
+
+    async def watch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - start - self.interval, 0.0)
+            self.max_lag = max(self.max_lag, lag)
+            self.total_lag += lag
+
+    def __str__(self):
+        return (
+            f'loop blocked max={self.max_lag * 1000:.1f}ms '
+            f'total={self.total_lag * 1000:.1f}ms, '
+            f'parse={self.parse_time * 1000:.1f}ms'
+        )
 
 
 class Image(multiprocessing.Process):
 
     def __init__(self, task_queue, result_queue,
-                 url, out_dir, mode, item):
+                 url, out_dir, mode, image_host, concurrency, parser,
+                 connector, fsync, resume, http_cache, retry_policy,
+                 retry_budget, adaptive, rate_limit, progress, worker_id,
+                 loop, eager, storage, layout, extractor, serving):
         multiprocessing.Process.__init__(self)
         self.task_queue = task_queue
         self.result_queue = result_queue
         self.url = url
         self.out_dir = out_dir
         self.mode = mode
-        self.item = item
+        self.image_host = image_host
+        self.concurrency = concurrency
+        self.parser = parser
+        self.extract = EXTRACTORS[extractor]
+        self.connector = connector
+        self.monitor = LoopMonitor()
+        self.connections = Counter()
+        self.fsync = fsync
+        self.writer = None
+        self.pending = None
+        self.written = None
+        self.manifest = Manifest(
+            os.path.join(out_dir, config['SCRAPER']['MANIFEST']),
+            track=resume
+        )
+        self.resume = resume
+        self.http_cache = http_cache
+        self.cache = None
+        self.retry_policy = retry_policy
+        self.results = None
+        self.retry_budget = retry_budget
+        self.adaptive = adaptive
+        self.rate_limit = rate_limit
+        self.progress = progress
+        self.worker_id = worker_id
+        self.counters = None
+        self.http = None
+        self.lock = None
+        self.loop = loop
+        self.eager = eager
+        self.storage = storage
+        self.layout = layout
+        self.serving = serving
+        self.store = None
+        self.limiter = None
+        self.remaining = {}
+        self.failed_pages = set()
 
-    async def get(self, url: str, session: ClientSession, content_type) -> str:
-        resp = await session.get(url)
-        if resp.status != 200:
-            logger.error(f'{self.name}:{url} failed, status={resp.status}')
-            return 'failed'
-        if content_type == 'text':
-            data = await resp.text()
-        else:
-            data = await resp.read()
+    async def get(
+            self,
+            url: str,
+            session: ClientSession,
+            content_type,
+            img_path: str = None
+    ):
+        from aiohttp import ClientError
+
+        self.retry_budget.deposit()
+        attempt = 0
+        kind = 'page' if content_type == 'text' else 'image'
+        while True:
+            await self.rate_limit.acquire(kind)
+            start = await self.limiter.acquire()
+            outcome = 'neutral'
+            self.counters[INFLIGHT] += 1
+            try:
+                data = await self.fetch(url, session, content_type, img_path)
+                if data != 'failed':
+                    outcome = 'ok'
+                return data
+            except (ClientError, asyncio.TimeoutError, RetryableStatus) as exc:
+                outcome = 'overload'
+                delay = self.retry_delay(url, attempt, exc)
+            finally:
+                self.counters[INFLIGHT] -= 1
+                self.limiter.release(start, outcome)
+            if delay is None:
+                return 'failed'
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def sync_get(self, url: str, content_type, img_path: str = None):
+        from requests import RequestException
+
+        self.retry_budget.deposit()
+        attempt = 0
+        kind = 'page' if content_type == 'text' else 'image'
+        while True:
+            self.rate_limit.wait(kind)
+            with self.lock:
+                self.counters[INFLIGHT] += 1
+            try:
+                return self.sync_fetch(url, content_type, img_path)
+            except (RequestException, RetryableStatus) as exc:
+                delay = self.retry_delay(url, attempt, exc)
+            finally:
+                with self.lock:
+                    self.counters[INFLIGHT] -= 1
+            if delay is None:
+                return 'failed'
+            attempt += 1
+            time.sleep(delay)
+
+    def retry_delay(self, url: str, attempt: int, exc: Exception):
+        """Seconds to wait before retrying `url`, None to give up."""
+        if attempt + 1 >= self.retry_policy.attempts:
+            self.retry_budget.gave_up()
+            logger.error(f'{self.name}:{url} failed, {exc!r}')
+            return None
+        if not self.retry_budget.withdraw():
+            logger.error(f'{self.name}:{url} failed, retry budget spent')
+            return None
+        delay = self.retry_policy.delay(
+            attempt, getattr(exc, 'retry_after', None)
+        )
+        logger.warning(
+            f'{self.name}:{url} {exc!r}, retry {attempt + 1} '
+            f'in {delay:.2f}s'
+        )
+        return delay
+
+    def check_status(self, url: str, status: int, headers) -> bool:
+        if status == 200:
+            return True
+        if self.retry_policy.retryable(status):
+            raise RetryableStatus(
+                status, parse_retry_after(headers.get('Retry-After'))
+            )
+        logger.error(f'{self.name}:{url} failed, status={status}')
+        return False
+
+    async def fetch(
+            self,
+            url: str,
+            session: ClientSession,
+            content_type,
+            img_path: str = None
+    ):
+        headers = await self.off_loop(
+            self.cache_headers, url, content_type, img_path
+        )
+        async with session.get(url, headers=headers) as resp:
+            if resp.status == 304:
+                return await self.off_loop(self.cache_hit, url, content_type)
+            if not self.check_status(url, resp.status, resp.headers):
+                return 'failed'
+            if content_type == 'text':
+                data = await resp.text()
+                await self.off_loop(self.cache_store, url, resp.headers, data)
+            else:
+                if self.store is None:
+                    data = await self.stream_to_file(resp, img_path)
+                else:
+                    data = await self.stream_to_store(resp, url)
+                await self.off_loop(self.cache_store, url, resp.headers)
+        return data
+
+    async def off_loop(self, func, *args):
+        # Cache entries are files; read and write them on the default
+        # executor so the event loop never blocks on disk.
+        if self.cache is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(
+            None, func, *args
+        )
+
+    def sync_fetch(self, url: str, content_type, img_path: str = None):
+        headers = self.cache_headers(url, content_type, img_path)
+        timeout = config['SCRAPER']['TIMEOUT']
+        with self.http.get(
+                url,
+                headers=headers,
+                stream=content_type != 'text',
+                timeout=(timeout, timeout)
+        ) as resp:
+            if resp.status_code == 304:
+                return self.cache_hit(url, content_type)
+            if not self.check_status(url, resp.status_code, resp.headers):
+                return 'failed'
+            if content_type == 'text':
+                data = resp.text
+                self.cache_store(url, resp.headers, data)
+            else:
+                if self.store is None:
+                    data = self.copy_to_file(resp, img_path)
+                else:
+                    data = self.copy_to_store(resp, url)
+                self.cache_store(url, resp.headers)
         return data
 
+    def copy_to_store(self, resp, image_url: str) -> int:
+        digest = self.store.hasher()
+        buffered = []
+        size = 0
+        f = None
+        claimed = False
+        try:
+            for chunk in resp.iter_content(config['SCRAPER']['CHUNK_SIZE']):
+                digest.update(chunk)
+                size += len(chunk)
+                if f is not None:
+                    f.write(chunk)
+                    continue
+                buffered.append(chunk)
+                if size > self.store.buffer:
+                    f = open(self.store.temp_path(), 'wb')
+                    f.writelines(buffered)
+                    buffered = []
+            hexdigest = digest.hexdigest()
+            while not claimed:
+                first = self.store.claim(hexdigest)
+                if first is None:
+                    claimed = True
+                elif first.result():
+                    if f is not None:
+                        f.close()
+                        os.remove(f.name)
+                    self.store.duplicate(hexdigest, image_url)
+                    return size
+            if f is None:
+                f = open(self.store.temp_path(), 'wb')
+                f.writelines(buffered)
+            f.close()
+            self.store.commit(f.name, hexdigest)
+        except BaseException:
+            if f is not None:
+                f.close()
+                FileWriter.remove(f.name)
+            if claimed:
+                self.store.abandon(hexdigest)
+            raise
+        self.store.stored(hexdigest, image_url)
+        return size
+
+    @staticmethod
+    def copy_to_file(resp, img_path: str) -> int:
+        # iter_content turns a truncated body into a retryable
+        # ChunkedEncodingError, reading resp.raw would not.
+        with open(img_path, 'wb') as f:
+            try:
+                for chunk in resp.iter_content(
+                        config['SCRAPER']['CHUNK_SIZE']
+                ):
+                    f.write(chunk)
+                return f.tell()
+            except BaseException:
+                f.close()
+                FileWriter.remove(img_path)
+                raise
+
+    def cache_headers(self, url: str, content_type,
+                      img_path: str = None) -> dict:
+        # An image is only revalidated while its file is still on disk.
+        if self.cache is None:
+            return {}
+        if content_type != 'text' and (
+                img_path is None or not os.path.exists(img_path)
+        ):
+            return {}
+        return self.cache.headers(url)
+
+    def cache_hit(self, url: str, content_type):
+        self.cache.hits += 1
+        if content_type == 'text':
+            return self.cache.body(url) or 'failed'
+        return 'cached'
+
+    def cache_store(self, url: str, headers, body: str = None) -> None:
+        if self.cache is not None:
+            self.cache.store(url, headers, body)
+
+    async def stream_to_file(self, resp, img_path: str) -> int:
+        # Only a bounded number of chunks per worker wait for the writer.
+        job = self.writer.open(img_path)
+        try:
+            async for chunk in resp.content.iter_chunked(
+                    config['SCRAPER']['CHUNK_SIZE']
+            ):
+                await self.pending.acquire()
+                self.writer.write(job, chunk, self.written)
+        except BaseException:
+            self.writer.abort(job)
+            raise
+        return await asyncio.wrap_future(self.writer.close(job))
+
+    async def stream_to_store(self, resp, image_url: str) -> int:
+        # Bodies up to the store's buffer are hashed in memory, so a
+        # duplicate is dropped before anything reaches the writer.
+        digest = self.store.hasher()
+        buffered = []
+        size = 0
+        job = None
+        claimed = False
+        try:
+            async for chunk in resp.content.iter_chunked(
+                    config['SCRAPER']['CHUNK_SIZE']
+            ):
+                digest.update(chunk)
+                size += len(chunk)
+                if job is None:
+                    buffered.append(chunk)
+                    if size <= self.store.buffer:
+                        continue
+                    job = self.writer.open(self.store.temp_path())
+                    await self.write_chunks(job, buffered)
+                    buffered = []
+                else:
+                    await self.write_chunks(job, [chunk])
+            hexdigest = digest.hexdigest()
+            # A copy still being written by another download is waited
+            # for, and written here if that download gives up.
+            while not claimed:
+                first = self.store.claim(hexdigest)
+                if first is None:
+                    claimed = True
+                elif await asyncio.wrap_future(first):
+                    if job is not None:
+                        self.writer.abort(job)
+                    self.store.duplicate(hexdigest, image_url)
+                    return size
+            if job is None:
+                job = self.writer.open(self.store.temp_path())
+                await self.write_chunks(job, buffered)
+            closed = self.writer.close(
+                job, functools.partial(self.store.commit, digest=hexdigest)
+            )
+            job = None
+            size = await asyncio.wrap_future(closed)
+        except BaseException:
+            if job is not None:
+                self.writer.abort(job)
+            if claimed:
+                self.store.abandon(hexdigest)
+            raise
+        self.store.stored(hexdigest, image_url)
+        return size
+
+    async def write_chunks(self, job, chunks: list) -> None:
+        for chunk in chunks:
+            await self.pending.acquire()
+            self.writer.write(job, chunk, self.written)
+
+    def release_pending(self, count: int) -> None:
+        for _ in range(count):
+            self.pending.release()
+
     async def aio_process(
             self,
             image_url: str,
             session: ClientSession,
             content_type: str
-    ) -> str:
-        img_path = f'{config["SCRAPER"]["OUT_DIR"]}/{image_url.split("/")[-1]}'
-        image = await self.get(image_url, session, content_type=content_type)
-        if image:
-            async with aiofiles.open(img_path, "wb") as file:
-                await file.write(image)
-        return f'Fetch succeeded: {image_url}'
-
-    async def asyncio_sessions(self, pages) -> None:
-        tasks = []
-        async with ClientSession() as session:
-            for page in pages:
+    ) -> tuple:
+        image = await self.get(
+            image_url,
+            session,
+            content_type=content_type,
+            img_path=self.image_path(image_url)
+        )
+        return self.image_status(image)
+
+    @staticmethod
+    def image_status(image) -> tuple:
+        """(status, size) for what get or sync_get returned."""
+        if image == 'failed':
+            return FAILED, 0
+        if image == 'cached':
+            return CACHED, 0
+        return SUCCEEDED, image
+
+    async def download_worker(
+            self,
+            images: asyncio.Queue,
+            session: ClientSession,
+            hosts: dict
+    ) -> None:
+        while True:
+            page, image_url = await images.get()
+            start = time.perf_counter()
+            try:
+                async with hosts[urlsplit(image_url).hostname]:
+                    status, size = await self.aio_process(
+                        image_url, session, content_type='image'
+                    )
+            except Exception as exc:
+                logger.error(f'{self.name}:{image_url} failed, {exc!r}')
+                status, size = FAILED, 0
+            finally:
+                images.task_done()
+            self.image_done(
+                page, image_url, status, size, time.perf_counter() - start
+            )
+            self.image_settled(page)
+
+    def image_settled(self, page: Page) -> None:
+        self.remaining[page] -= 1
+        if self.remaining[page] == 0:
+            del self.remaining[page]
+            self.page_done(page)
+
+    def image_done(self, page: Page, image_url: str, status: int,
+                   size: int, latency: float) -> None:
+        if status == FAILED:
+            self.failed_pages.add(page)
+        else:
+            self.manifest.add_image(image_url)
+        self.record(page, status, image_url, size, latency)
+
+    def record(self, page: Page, status: int, url: str, size: int = 0,
+               latency: float = 0.0) -> None:
+        self.results.add(status, url, size, latency, page.job)
+        if status in (PAGE_FAILED, PAGE_DONE):
+            self.counters[PAGES] += 1
+        else:
+            self.counters[IMAGES] += 1
+            self.counters[BYTES] += size
+        if status in (FAILED, PAGE_FAILED):
+            self.counters[FAILURES] += 1
+        if status in (PAGE_FAILED, PAGE_DONE) and self.serving:
+            # A daemon job is only reported once all its pages are in.
+            self.results.flush()
+
+    def page_done(self, page: Page) -> None:
+        if page in self.failed_pages:
+            self.failed_pages.discard(page)
+        else:
+            self.manifest.add_page(str(page))
+        self.record(page, PAGE_DONE, self.page_url(page))
+
+    def skip_done(self, page: Page, image_urls: list) -> list:
+        """Report images already in the manifest and return the rest.
+
+        Only with --resume: without it every run downloads afresh, and the
+        manifest entries this worker adds must not skip a later job's
+        images.
+        """
+        if not self.resume:
+            return image_urls
+        todo = []
+        for image_url in image_urls:
+            if image_url in self.manifest.images:
+                self.record(page, SKIPPED, image_url)
+            else:
+                todo.append(image_url)
+        return todo
+
+    async def page_feeder(
+            self,
+            pages: asyncio.Queue,
+            documents: asyncio.Queue,
+            slots: asyncio.Semaphore
+    ) -> int:
+        # A page is taken from task_queue only when one of the worker's
+        # slots is free, so pages go to whichever worker catches up first.
+        loop = asyncio.get_running_loop()
+        count = 0
+        while True:
+            await slots.acquire()
+            task = await loop.run_in_executor(None, self.next_page)
+            if task is None:
+                slots.release()
+                return count
+            count += 1
+            if task.image_urls is not None:
+                # Already parsed in main, straight to the parser.
+                await documents.put((task.page, list(task.image_urls)))
+            else:
+                await pages.put(task.page)
+
+    async def page_fetcher(
+            self,
+            pages: asyncio.Queue,
+            documents: asyncio.Queue,
+            session: ClientSession
+    ) -> None:
+        while True:
+            page = await pages.get()
+            try:
                 response = await self.get(
-                    url=config['SCRAPER']['URL'] + f'p{page}/{self.item}.html',
+                    url=self.page_url(page),
                     session=session,
                     content_type='text'
                 )
-                tree = html.fromstring(response)
-                amount_pages = 1
-                for page_number in range(amount_pages):
-                    page_number += 1
-                    for image_url in tree.xpath('//img/@src'):
-                        if 'images.stockfreeimages.com' in image_url:
-                            tasks.append(
-                                self.aio_process(
-                                    image_url, session, content_type='image'
-                                )
-                            )
-            results = await asyncio.gather(*tasks)
-        # send result status
-        for r in results:
-            self.result_queue.put(r)
-
-    def sync_process(self, pages: list) -> None:
-        for page in pages:
-            res = requests.get(self.url + f'p{page}/{self.item}.html')
-            tree = html.fromstring(res.text)
-            for image_url in tree.xpath('//img/@src'):
-                if 'images.stockfreeimages.com' in image_url:
-                    r = requests.get(image_url, stream=True)
-                    if r.status_code == 200:
-                        with open(
-                                f'images/{image_url.split("/")[-1]}',
-                                'wb'
-                        ) as f:
-                            r.raw.decode_content = True
-                            shutil.copyfileobj(r.raw, f)
-                        self.result_queue.put(f'{page} fetch succeeded')
+            except Exception as exc:
+                logger.error(f'{self.name}:page {page} failed, {exc!r}')
+                response = 'failed'
+            finally:
+                pages.task_done()
+            if response == 'failed':
+                self.record(page, PAGE_FAILED, self.page_url(page))
+            await documents.put((page, response))
+
+    async def page_parser(
+            self,
+            documents: asyncio.Queue,
+            images: asyncio.Queue,
+            slots: asyncio.Semaphore,
+            executor
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            page, response = await documents.get()
+            queued = 0
+            try:
+                if response == 'failed':
+                    continue
+                start = time.perf_counter()
+                if isinstance(response, list):
+                    image_urls = response
+                elif executor is None:
+                    image_urls = self.extract(response, self.image_host)
+                else:
+                    image_urls = await loop.run_in_executor(
+                        executor, self.extract, response, self.image_host
+                    )
+                self.monitor.parse_time += time.perf_counter() - start
+                image_urls = self.skip_done(page, image_urls)
+                if not image_urls:
+                    self.page_done(page)
+                    continue
+                self.remaining[page] = len(image_urls)
+                for image_url in image_urls:
+                    # Blocks while the download queue is full, which
+                    # also keeps this worker from taking more pages.
+                    await images.put((page, image_url))
+                    queued += 1
+            except Exception as exc:
+                logger.error(f'{self.name}:page {page} failed, {exc!r}')
+                # Every page must end in exactly one page record, or a
+                # daemon job waits for it forever.
+                if queued:
+                    # Finishes once the queued images settle (some may
+                    # have already), but is not marked done in the
+                    # manifest.
+                    self.failed_pages.add(page)
+                    self.remaining[page] -= len(image_urls) - queued
+                    if self.remaining[page] == 0:
+                        del self.remaining[page]
+                        self.page_done(page)
+                else:
+                    self.remaining.pop(page, None)
+                    self.record(page, PAGE_FAILED, self.page_url(page))
+            finally:
+                documents.task_done()
+                slots.release()
+
+    def trace_connections(self) -> TraceConfig:
+        from aiohttp import TraceConfig
+
+        async def on_create(session, context, params):
+            self.connections['new'] += 1
+
+        async def on_reuse(session, context, params):
+            self.connections['reused'] += 1
+
+        trace_config = TraceConfig()
+        trace_config.on_connection_create_end.append(on_create)
+        trace_config.on_connection_reuseconn.append(on_reuse)
+        return trace_config
+
+    def make_limiter(self) -> AdaptiveLimiter:
+        # Room for every download worker and page fetcher at the top end;
+        # with adaptive mode off the limit is pinned there.
+        maximum = self.concurrency + config['SCRAPER']['PAGE_FETCHERS']
+        if not self.adaptive:
+            return AdaptiveLimiter(maximum, maximum, maximum)
+        adaptive = config['SCRAPER']['ADAPTIVE']
+        return AdaptiveLimiter(
+            adaptive['INITIAL'],
+            adaptive['MIN'],
+            maximum,
+            adaptive['TOLERANCE'],
+            adaptive['BACKOFF']
+        )
+
+    async def asyncio_sessions(self) -> int:
+        # Pages flow feeder -> fetchers -> parser -> downloaders, so images
+        # of one page download while the next pages are still fetched.
+        from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+        slots = asyncio.Semaphore(config['SCRAPER']['PAGES_IN_FLIGHT'])
+        pages = asyncio.Queue()
+        documents = asyncio.Queue()
+        images = asyncio.Queue(maxsize=config['SCRAPER']['QUEUE_SIZE'])
+        per_host = config['SCRAPER']['PER_HOST']
+        hosts = defaultdict(lambda: asyncio.Semaphore(per_host))
+        loop = asyncio.get_running_loop()
+        self.limiter = self.make_limiter()
+        self.pending = asyncio.Semaphore(config['SCRAPER']['WRITER_PENDING'])
+        self.written = functools.partial(
+            loop.call_soon_threadsafe, self.release_pending
+        )
+        self.writer = FileWriter(
+            config['SCRAPER']['WRITER_THREADS'],
+            config['SCRAPER']['WRITER_BATCH'],
+            self.fsync
+        )
+        self.writer.start()
+        executor = PARSERS[self.parser]
+        if executor is not None:
+            executor = executor(config['SCRAPER']['PARSER_WORKERS'])
+        timeout = config['SCRAPER']['TIMEOUT']
+        async with ClientSession(
+                connector=TCPConnector(**self.connector),
+                timeout=ClientTimeout(sock_connect=timeout, sock_read=timeout),
+                trace_configs=[self.trace_connections()]
+        ) as session:
+            stages = [asyncio.create_task(self.monitor.watch())]
+            stages.extend(
+                asyncio.create_task(
+                    self.page_fetcher(pages, documents, session)
+                )
+                for _ in range(config['SCRAPER']['PAGE_FETCHERS'])
+            )
+            stages.append(asyncio.create_task(
+                self.page_parser(documents, images, slots, executor)
+            ))
+            stages.extend(
+                asyncio.create_task(
+                    self.download_worker(images, session, hosts)
+                )
+                for _ in range(self.concurrency)
+            )
+            count = await self.page_feeder(pages, documents, slots)
+            for queue in (pages, documents, images):
+                await queue.join()
+            for stage in stages:
+                stage.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+        if executor is not None:
+            executor.shutdown()
+        await loop.run_in_executor(None, self.writer.stop)
+        return count
+
+    def sync_process(self) -> int:
+        pages = 0
+        for task in iter(self.next_page, None):
+            pages += 1
+            page = task.page
+            image_urls = self.sync_page(task)
+            if image_urls is None:
+                continue
+            for image_url in image_urls:
+                try:
+                    status, size, latency = self.fetch_image(image_url)
+                except Exception as exc:
+                    logger.error(f'{self.name}:{image_url} failed, {exc!r}')
+                    status, size, latency = FAILED, 0, 0.0
+                self.image_done(page, image_url, status, size, latency)
+            self.page_done(page)
+        return pages
+
+    def threads_process(self) -> int:
+        # Pages are fetched on this thread while the pool downloads the
+        # previous pages' images; a new page is only taken once fewer than
+        # two rounds of downloads are pending.
+        pages = 0
+        pending = {}
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            for task in iter(self.next_page, None):
+                pages += 1
+                page = task.page
+                image_urls = self.sync_page(task)
+                if image_urls is None:
+                    continue
+                if not image_urls:
+                    self.page_done(page)
+                    continue
+                self.remaining[page] = len(image_urls)
+                for image_url in image_urls:
+                    while len(pending) >= 2 * self.concurrency:
+                        self.settle(pending, FIRST_COMPLETED)
+                    future = executor.submit(self.fetch_image, image_url)
+                    pending[future] = (page, image_url)
+            while pending:
+                self.settle(pending, ALL_COMPLETED)
+        return pages
+
+    def settle(self, pending: dict, return_when) -> None:
+        done, _ = wait(pending, return_when=return_when)
+        for future in done:
+            page, image_url = pending.pop(future)
+            try:
+                status, size, latency = future.result()
+            except Exception as exc:
+                logger.error(f'{self.name}:{image_url} failed, {exc!r}')
+                status, size, latency = FAILED, 0, 0.0
+            self.image_done(page, image_url, status, size, latency)
+            self.image_settled(page)
+
+    def sync_page(self, task: PageTask):
+        """Image URLs of the page still to download, None if it failed."""
+        page = task.page
+        try:
+            if task.image_urls is not None:
+                return self.skip_done(page, list(task.image_urls))
+            response = self.sync_get(self.page_url(page), content_type='text')
+            if response != 'failed':
+                image_urls = self.extract(response, self.image_host)
+                return self.skip_done(page, image_urls)
+        except Exception as exc:
+            logger.error(f'{self.name}:page {page} failed, {exc!r}')
+        self.record(page, PAGE_FAILED, self.page_url(page))
+        return None
+
+    def fetch_image(self, image_url: str) -> tuple:
+        start = time.perf_counter()
+        image = self.sync_get(
+            image_url,
+            content_type='image',
+            img_path=self.image_path(image_url)
+        )
+        return (*self.image_status(image), time.perf_counter() - start)
+
+    def image_path(self, image_url: str):
+        if self.store is not None:
+            return self.store.path_for_url(image_url)
+        return self.layout.path(image_url)
+
+    def run_loop(self, coro):
+        loop_factory = asyncio.new_event_loop
+        if self.loop == 'uvloop':
+            import uvloop
+            loop_factory = uvloop.new_event_loop
+        if not hasattr(asyncio, 'Runner'):
+            # Python < 3.11, which has no eager task factory either.
+            loop = loop_factory()
+            asyncio.set_event_loop(loop)
+            try:
+                return loop.run_until_complete(coro)
+            finally:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+                asyncio.set_event_loop(None)
+                loop.close()
+        with asyncio.Runner(loop_factory=loop_factory) as runner:
+            # Eager tasks run until their first real suspension inside
+            # create_task, so ones that finish straight away skip a trip
+            # through the ready queue (Python 3.12+).
+            if self.eager and hasattr(asyncio, 'eager_task_factory'):
+                runner.get_loop().set_task_factory(asyncio.eager_task_factory)
+            return runner.run(coro)
+
+    def pooled_session(self) -> requests.Session:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        # --limit caps connections per host pool as in async mode;
+        # blocking makes it a real cap rather than a keep-alive size.
+        limit = self.connector['limit']
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_maxsize=limit or self.concurrency,
+            pool_block=bool(limit)
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def page_url(self, page: Page) -> str:
+        return self.url + f'p{page.number}/{page.item}.html'
+
+    def next_page(self):
+        """Next PageTask from task_queue, None once 'done' arrives."""
+        task = self.task_queue.get()
+        self.task_queue.task_done()
+        if task == 'done':
+            return None
+        return task
 
     def run(self):
         proc_name = self.name
-        pages = []
 
-        # Get all tasks
-        while True:
-            task = self.task_queue.get()
-            if task == 'done':
-                logger.debug(f'{proc_name} Downloaded all images')
-                break
-            pages.append(task)
-            self.task_queue.task_done()
-
-        logger.info(f'{proc_name} downloading {self.mode} {len(pages)} images')
-        # Do sync or async processing
+        logger.info(f'{proc_name} downloading {self.mode}')
+        if self.serving:
+            # Ctrl-C is for the daemon, which drains the queue first.
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+        self.results = ResultBatch(
+            self.result_queue, proc_name, config['SCRAPER']['RESULT_BATCH']
+        )
+        # main counts finished workers, so 'done' must be sent even when
+        # setup or the crawl crashed
+        crashed = True
+        try:
+            self.counters = self.progress.row(self.worker_id)
+            self.lock = threading.Lock()
+            if self.resume:
+                self.manifest.load()
+            self.manifest.open()
+            if self.http_cache:
+                self.cache = ValidatorCache(config['SCRAPER']['CACHE_DIR'])
+            if self.storage == 'cas':
+                cas = config['SCRAPER']['CAS']
+                self.store = ContentStore(
+                    self.out_dir, cas['LEVELS'], cas['WIDTH'], cas['BUFFER']
+                )
+                self.store.open()
+            # Do sync or async processing, pulling pages as they arrive
+            if self.mode == "async":
+                pages = self.run_loop(self.asyncio_sessions())
+            elif self.mode == "threads":
+                self.http = self.pooled_session()
+                with self.http:
+                    pages = self.threads_process()
+            else:
+                import requests
+
+                self.http = requests
+                pages = self.sync_process()
+            crashed = False
+        finally:
+            self.manifest.close()
+            if self.store is not None:
+                self.store.close()
+            self.results.close(crashed)
+            self.progress.close(self.counters)
         if self.mode == "async":
-            asyncio.run(self.asyncio_sessions(pages))
-        else:
-            self.sync_process(pages)
-        self.task_queue.task_done()
+            logger.info(f'{proc_name} {self.parser} parser, {self.monitor}')
+            logger.info(
+                f'{proc_name} connections new={self.connections["new"]} '
+                f'reused={self.connections["reused"]}'
+            )
+            logger.info(f'{proc_name} {self.writer}')
+            logger.info(f'{proc_name} {self.limiter}')
+        if self.cache is not None:
+            logger.info(f'{proc_name} {self.cache}')
+        if self.store is not None:
+            logger.info(f'{proc_name} {self.store}')
+        logger.debug(f'{proc_name} Downloaded all images from {pages} pages')
 
     def __str__(self):
         return 'Image %s.' % self.name
 
 
+def process_count_arg(value: str):
+    if value == 'auto':
+        return value
+    try:
+        count = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{value!r} is not a number or auto')
+    if count < 1:
+        raise argparse.ArgumentTypeError('at least one process is needed')
+    return count
+
+
+def warm_up(image_urls: list, samples: int) -> float:
+    """Median seconds to response headers over a few image requests."""
+    from http.client import HTTPException
+    from urllib.request import urlopen
+
+    timings = []
+    for image_url in image_urls[:samples]:
+        started = time.perf_counter()
+        try:
+            with urlopen(image_url, timeout=config['SCRAPER']['TIMEOUT']):
+                timings.append(time.perf_counter() - started)
+        except (OSError, HTTPException) as exc:
+            logger.warning(f'Warm-up {image_url} failed, {exc!r}')
+    return statistics.median(timings) if timings else None
+
+
+def auto_process(amount_pages: int, images_per_page: int,
+                 rtt: float, parse_cost: float) -> tuple:
+    """Pick (process count, per-process concurrency) for the crawl.
+
+    By Little's law a process with `concurrency` requests in flight
+    completes `concurrency / rtt` of them per second, each costing
+    `cpu_per_request`; concurrency is sized so that stays at TARGET_CPU
+    of one core. Processes cover the remaining work, bounded by cores
+    and pages.
+    """
+    auto = config['SCRAPER']['AUTO']
+    cpu_per_request = (
+        parse_cost / (images_per_page + 1) + auto['REQUEST_CPU']
+    )
+    concurrency = int(auto['TARGET_CPU'] * rtt / cpu_per_request)
+    concurrency = min(max(concurrency, 1), auto['MAX_CONCURRENCY'])
+    requests_total = amount_pages * (images_per_page + 1)
+    process_count = min(
+        multiprocessing.cpu_count(),
+        amount_pages,
+        math.ceil(requests_total / concurrency)
+    )
+    return max(process_count, 1), concurrency
+
+
+def cli_items(args) -> list:
+    items = parse_items(args.item)
+    if args.item_file:
+        items.extend(read_items(args.item_file))
+    return list(dict.fromkeys(items))
+
+
+def job_pages(discoveries: dict, limit: int, job: int = 0) -> list:
+    return [
+        Page(item, number, job)
+        for item, discovery in discoveries.items()
+        for number in range(1, min(limit, discovery.pages) + 1)
+    ]
+
+
+def page_tasks(pages: list, discoveries: dict):
+    # Pages 1 were parsed during discovery, their workers skip the fetch.
+    for page in pages:
+        yield PageTask(
+            page,
+            discoveries[page.item].image_urls if page.number == 1 else None
+        )
+
+
+def interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(args, task_queue, result_queue, images: list,
+          cache: DiscoveryCache, retry_policy: RetryPolicy) -> None:
+    """Queue jobs from the Unix socket at --serve until interrupted, then
+    let the workers drain the queue."""
+    from service import JobBoard, JobServer
+
+    board = JobBoard()
+    manifest_path = os.path.join(args.out_dir, config['SCRAPER']['MANIFEST'])
+    # Admissions still discovering must queue their pages before the
+    # workers' 'done', and none may start once shutdown began.
+    admissions = threading.Condition()
+    state = {'closing': False, 'admitting': 0}
+
+    def admit(request: dict) -> Job:
+        with admissions:
+            if state['closing']:
+                raise RuntimeError('daemon is shutting down')
+            state['admitting'] += 1
+        try:
+            return queue_job(request)
+        finally:
+            with admissions:
+                state['admitting'] -= 1
+                admissions.notify_all()
+
+    def queue_job(request: dict) -> Job:
+        items = parse_items(request['items'])
+        discoveries = discover_all(
+            args.url, items, args.image_host, EXTRACTORS[args.extractor],
+            cache, config['SCRAPER']['DISCOVERY']['WORKERS'], retry_policy,
+            config['SCRAPER']['TIMEOUT']
+        )
+        if not discoveries:
+            raise ValueError(f'none of {", ".join(items)} could be found')
+        job_id = board.next_id()
+        pages = job_pages(
+            discoveries, int(request.get('pages', args.pages)), job_id
+        )
+        if args.resume:
+            finished = Manifest(manifest_path).load().pages
+            pages = [page for page in pages if str(page) not in finished]
+        job = board.open(job_id, len(pages))
+        for task in page_tasks(pages, discoveries):
+            task_queue.put(task)
+        logger.info(f'Job {job_id}: {len(pages)} pages of {", ".join(items)}')
+        return job
+
+    def collect():
+        remaining = len(images)
+        while remaining:
+            try:
+                kind, payload = result_queue.get(timeout=1)
+            except queue.Empty:
+                # A killed worker never sends 'done'.
+                if all(image.exitcode is not None for image in images):
+                    return
+                continue
+            if kind == 'results':
+                board.route(payload)
+            elif kind == 'done':
+                remaining -= 1
+                name, crashed = payload
+                if crashed:
+                    logger.error(f'{name} crashed')
+
+    def alive() -> bool:
+        return all(image.exitcode in (None, 0) for image in images)
+
+    collector = threading.Thread(target=collect, daemon=True)
+    collector.start()
+    server = JobServer(args.serve, admit, alive)
+    signal.signal(signal.SIGTERM, interrupt)
+    logger.info(f'Serving {args.mode} jobs on {args.serve}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info('Shutting down, finishing queued jobs')
+    finally:
+        with admissions:
+            state['closing'] = True
+            admissions.wait_for(lambda: state['admitting'] == 0)
+        for _ in images:
+            task_queue.put('done')
+        collector.join()
+        # Waits for the handlers to send their reports.
+        server.server_close()
+
+
+def submit_job(args) -> None:
+    from service import submit
+
+    request = {'items': cli_items(args), 'pages': args.pages}
+    for reply in submit(args.submit, request):
+        if 'error' in reply:
+            raise SystemExit(f'Job failed: {reply["error"]}')
+        if 'queued' in reply:
+            logger.info(f'Job {reply["job"]}: {reply["queued"]} pages queued')
+            continue
+        logger.info(f'Job {reply["job"]} done')
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump(reply['report'], f, indent=2)
+        else:
+            print(json.dumps(reply['report'], indent=2))
+        return
+    raise SystemExit('Daemon closed the connection before the report')
+
+
 def parse_cli_args():
     mparser = argparse.ArgumentParser(
         description='Evaluate sync vs async multiprocessing')
@@ -121,66 +1109,364 @@ def parse_cli_args():
                          '--mode',
                          action='store',
                          default='async',
-                         choices=['sync', 'async'],
+                         choices=['sync', 'async', 'threads'],
                          help='evaluation mode')
 
+    mparser.add_argument('--loop',
+                         action='store',
+                         default=config['SCRAPER']['LOOP'],
+                         choices=['asyncio', 'uvloop'],
+                         help='event loop for async mode')
+
+    mparser.add_argument('--eager',
+                         action=argparse.BooleanOptionalAction,
+                         default=config['SCRAPER']['EAGER_TASKS'],
+                         help='eager task factory in async mode '
+                              '(Python 3.12+)')
+
     mparser.add_argument('-p',
                          '--process',
                          action='store',
-                         type=int,
+                         type=process_count_arg,
                          default=4,
-                         help='multiprocessing count')
+                         help='multiprocessing count, or auto to size it '
+                              'from a warm-up')
+
+    mparser.add_argument('--url',
+                         action='store',
+                         default=config['SCRAPER']['URL'],
+                         help='site root, listing pages are <url>p<n>/<item>'
+                              '.html')
+
+    mparser.add_argument('--item',
+                         action='store',
+                         type=parse_items,
+                         default=config['SCRAPER']['ITEM'],
+                         help='category to crawl, or several separated by '
+                              'commas')
+
+    mparser.add_argument('--item-file',
+                         action='store',
+                         help='file with more categories, one per line')
+
+    mparser.add_argument('--pages',
+                         action='store',
+                         type=int,
+                         default=config['SCRAPER']['AMOUNT_PAGES'],
+                         help='pages to crawl at most per category')
+
+    mparser.add_argument('--image-host',
+                         action='store',
+                         default=config['SCRAPER']['IMAGE_HOST'],
+                         help='only image URLs containing this are fetched')
+
+    mparser.add_argument('-o',
+                         '--out-dir',
+                         action='store',
+                         default=config['SCRAPER']['OUT_DIR'],
+                         help='directory images are saved to')
+
+    mparser.add_argument('--storage',
+                         action='store',
+                         default=config['SCRAPER']['STORAGE'],
+                         choices=['flat', 'cas'],
+                         help='flat: files named after the URL, cas: '
+                              'stored once per content hash')
+
+    mparser.add_argument('--layout',
+                         action='store',
+                         default=config['SCRAPER']['LAYOUT'],
+                         choices=['flat', 'sharded'],
+                         help='sharded: spread files over hash-prefix '
+                              'subdirectories of the output directory')
+
+    mparser.add_argument('--report',
+                         action='store',
+                         help='write the final summary as JSON to this file')
+
+    mparser.add_argument('--serve',
+                         action='store',
+                         metavar='SOCKET',
+                         help='keep the workers running and take jobs on '
+                              'this Unix socket')
+
+    mparser.add_argument('--submit',
+                         action='store',
+                         metavar='SOCKET',
+                         help='send --item/--pages as a job to a daemon '
+                              'started with --serve and wait for its report')
+
+    mparser.add_argument('-c',
+                         '--concurrency',
+                         action='store',
+                         type=int,
+                         help='concurrent image downloads per process, '
+                              'defaults to CONCURRENCY or the auto value')
+
+    mparser.add_argument('--adaptive',
+                         action=argparse.BooleanOptionalAction,
+                         default=config['SCRAPER']['ADAPTIVE']['ENABLED'],
+                         help='tune in-flight requests from latency and '
+                              'errors, up to --concurrency')
+
+    mparser.add_argument('--discovery-ttl',
+                         type=float,
+                         default=config['SCRAPER']['DISCOVERY']['TTL'],
+                         help='seconds the page count and page 1 found by '
+                              'an earlier run are reused, 0 disables')
+
+    mparser.add_argument('--parser',
+                         action='store',
+                         default=config['SCRAPER']['PARSER'],
+                         choices=list(PARSERS),
+                         help='where listing pages are parsed')
+
+    mparser.add_argument('--extractor',
+                         action='store',
+                         default=config['SCRAPER']['EXTRACTOR'],
+                         choices=list(EXTRACTORS),
+                         help='how image URLs are pulled out of a listing '
+                              'page, see bench_extractors.py')
+
+    mparser.add_argument('--fsync',
+                         action='store',
+                         default=config['SCRAPER']['FSYNC'],
+                         choices=FSYNC,
+                         help='fsync each file, once at the end, or never')
+
+    mparser.add_argument('--resume',
+                         action='store_true',
+                         default=config['SCRAPER']['RESUME'],
+                         help='skip pages and images finished by a '
+                              'previous run')
+
+    mparser.add_argument('--retries',
+                         action='store',
+                         type=int,
+                         default=config['SCRAPER']['RETRY']['ATTEMPTS'],
+                         help='attempts per request, including the first')
+
+    mparser.add_argument('--page-rate',
+                         action='store',
+                         type=float,
+                         default=config['SCRAPER']['RATE_LIMIT']['PAGES'],
+                         help='page requests per second across all '
+                              'processes, 0 is unlimited')
+
+    mparser.add_argument('--image-rate',
+                         action='store',
+                         type=float,
+                         default=config['SCRAPER']['RATE_LIMIT']['IMAGES'],
+                         help='image requests per second across all '
+                              'processes, 0 is unlimited')
+
+    mparser.add_argument('--http-cache',
+                         action=argparse.BooleanOptionalAction,
+                         default=config['SCRAPER']['HTTP_CACHE'],
+                         help='revalidate pages and images with '
+                              'ETag/Last-Modified')
+
+    connector = config['SCRAPER']['CONNECTOR']
+    mparser.add_argument('--limit',
+                         action='store',
+                         type=int,
+                         default=connector['LIMIT'],
+                         help='open connections per process, 0 is unlimited')
+
+    mparser.add_argument('--limit-per-host',
+                         action='store',
+                         type=int,
+                         default=connector['LIMIT_PER_HOST'],
+                         help='open connections per host, 0 is unlimited')
+
+    mparser.add_argument('--keepalive-timeout',
+                         action='store',
+                         type=float,
+                         default=connector['KEEPALIVE_TIMEOUT'],
+                         help='seconds an idle connection is kept open')
+
+    mparser.add_argument('--dns-ttl',
+                         action='store',
+                         type=int,
+                         default=connector['TTL_DNS_CACHE'],
+                         help='seconds a DNS answer is cached, 0 disables')
 
     return mparser.parse_args()
 
 
 def main():
 
+    started = time.perf_counter()
     args = parse_cli_args()
+    if args.submit:
+        return submit_job(args)
+    if args.loop == 'uvloop' and importlib.util.find_spec('uvloop') is None:
+        raise SystemExit('--loop uvloop needs uvloop: pip install uvloop')
+    if args.eager and not hasattr(asyncio, 'eager_task_factory'):
+        # Reported as off too, so runs on old Pythons are not mislabelled.
+        if args.mode == 'async':
+            logger.warning('--eager needs Python 3.12+, running without it')
+        args.eager = False
 
-    process_count = args.parallel
-    url = config['SCRAPER']['URL']
-    out_dir = config['SCRAPER']['OUT_DIR']
-    amount_pages = config['SCRAPER']['AMOUNT_PAGES']
-    item = config['SCRAPER']['ITEM']
+    process_count = args.process
+    concurrency = args.concurrency or config['SCRAPER']['CONCURRENCY']
+    url = args.url
+    out_dir = args.out_dir
+    items = cli_items(args)
 
-    response = requests.get(f'{url}/p1/{item}.html')
-    tree = html.fromstring(response.text)
-    amount_pages_on_site = int(
-        tree.xpath('//li[@class="pag-text"]/text()')[0].split()[1]
+    discovery_config = config['SCRAPER']['DISCOVERY']
+    discovery_cache = DiscoveryCache(
+        discovery_config['CACHE'], args.discovery_ttl
+    )
+    retry_policy = RetryPolicy.from_config(
+        config['SCRAPER']['RETRY'], args.retries
     )
-    if amount_pages > amount_pages_on_site:
-        amount_pages = amount_pages_on_site
+    discoveries = {}
+    # A daemon only discovers its jobs' categories, unless --process auto
+    # needs them to size the pool.
+    if not args.serve or process_count == 'auto':
+        discoveries = discover_all(
+            url, items, args.image_host, EXTRACTORS[args.extractor],
+            discovery_cache, discovery_config['WORKERS'], retry_policy,
+            config['SCRAPER']['TIMEOUT']
+        )
+        if not discoveries:
+            raise SystemExit(f'None of {", ".join(items)} could be found')
+    all_pages = job_pages(discoveries, args.pages)
 
-    logger.info(f'Processing {args.mode} {amount_pages} images')
+    if process_count == 'auto':
+        first = next(iter(discoveries.values()))
+        parse_cost = statistics.mean(
+            discovery.parse_cost for discovery in discoveries.values()
+        )
+        images_per_page = statistics.mean(
+            len(discovery.image_urls) for discovery in discoveries.values()
+        )
+        rtt = warm_up(
+            list(first.image_urls), config['SCRAPER']['AUTO']['SAMPLES']
+        )
+        if rtt is None:
+            rtt = first.rtt
+        process_count, auto_concurrency = auto_process(
+            len(all_pages), round(images_per_page), rtt, parse_cost
+        )
+        concurrency = args.concurrency or auto_concurrency
+        logger.info(
+            f'Auto: rtt={rtt * 1000:.0f}ms '
+            f'parse={parse_cost * 1000:.1f}ms/page, '
+            f'{process_count} processes x {concurrency} concurrency'
+        )
+
+    shard = config['SCRAPER']['SHARD']
+    layout = Layout(
+        out_dir,
+        shard['LEVELS'] if args.layout == 'sharded' else 0,
+        shard['WIDTH'],
+    )
+    if args.storage == 'cas':
+        cas = config['SCRAPER']['CAS']
+        ContentStore(
+            out_dir, cas['LEVELS'], cas['WIDTH'], cas['BUFFER']
+        ).create()
+    else:
+        layout.create()
+    manifest = Manifest(os.path.join(out_dir, config['SCRAPER']['MANIFEST']))
+    if args.resume:
+        manifest.load()
+    else:
+        manifest.reset()
+    pages = [page for page in all_pages if str(page) not in manifest.pages]
+    if not args.serve:
+        if not pages:
+            logger.info(f'All {len(all_pages)} pages already downloaded')
+            return
+        logger.info(
+            f'Processing {args.mode} {len(pages)} pages of {len(items)} '
+            f'categories'
+        )
+
+    connector = {
+        'limit': args.limit,
+        'limit_per_host': args.limit_per_host,
+        'keepalive_timeout': args.keepalive_timeout,
+        'use_dns_cache': args.dns_ttl > 0,
+        'ttl_dns_cache': args.dns_ttl or None,
+    }
+
+    retry_budget = RetryBudget.from_config(config['SCRAPER']['RETRY'])
+    rate_limit = SharedTokenBucket.from_config(
+        config['SCRAPER']['RATE_LIMIT'], args.page_rate, args.image_rate
+    )
+    logger.info(f'Rate limit: {rate_limit}')
+
+    progress = Progress(process_count)
 
     task_queue = multiprocessing.JoinableQueue()
     result_queue = multiprocessing.Queue()
-    if process_count < multiprocessing.cpu_count():
-        process_count = multiprocessing.cpu_count()
     logger.info(f'Spawning {process_count} gatherers...')
 
     images = [
-        Image(task_queue, result_queue, url, out_dir, args.mode, item)
-        for _ in range(process_count)
+        Image(task_queue, result_queue, url, out_dir, args.mode,
+              args.image_host,
+              concurrency, args.parser, connector, args.fsync,
+              args.resume, args.http_cache, retry_policy, retry_budget,
+              args.adaptive, rate_limit, progress, worker_id, args.loop,
+              args.eager, args.storage, layout, args.extractor,
+              bool(args.serve))
+        for worker_id in range(process_count)
     ]
 
     for image in images:
         image.start()
 
-    for page_number in range(amount_pages):
-        task_queue.put(page_number + 1)
+    failed = False
+    if args.serve:
+        serve(args, task_queue, result_queue, images, discovery_cache,
+              retry_policy)
+        logger.info(f'Stopped, {retry_budget}')
+    else:
+        for task in page_tasks(pages, discoveries):
+            task_queue.put(task)
 
-    for _ in range(process_count):
-        task_queue.put('done')
+        for _ in range(process_count):
+            task_queue.put('done')
 
-    fail_count = sum(
-        1 for _ in range(amount_pages) if 'failed' in result_queue.get()
-    )
-    logger.info(
-        f'Done, success: {amount_pages - fail_count}/{amount_pages}, '
-        f'failure: {fail_count}/{amount_pages}'
-    )
+        summary = Summary()
+        summary.collect(
+            result_queue,
+            images,
+            ProgressReport(progress, len(pages)),
+            config['SCRAPER']['PROGRESS_INTERVAL']
+        )
+        logger.info(f'Done, {summary}, {retry_budget}')
+        # A worker that crashed or was killed leaves its pages unreported.
+        unaccounted = len(pages) - summary.pages
+        if summary.crashed:
+            logger.error(f'Crashed: {", ".join(summary.crashed)}')
+        if unaccounted:
+            logger.error(f'{unaccounted} of {len(pages)} pages unaccounted '
+                         f'for')
+        failed = bool(unaccounted or summary.crashed)
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump(
+                    summary.report(time.perf_counter() - started,
+                                   mode=args.mode,
+                                   loop=args.loop,
+                                   eager=args.eager,
+                                   processes=process_count,
+                                   concurrency=concurrency,
+                                   unaccounted=unaccounted),
+                    f,
+                    indent=2
+                )
+
+    for image in images:
+        image.join()
+    rate_limit.close()
+    progress.close()
+    if failed:
+        raise SystemExit(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,91 @@
+import asyncio
+import time
+from collections import deque
+
+
+class AdaptiveLimiter:
+    """AIMD limit on in-flight requests of one event loop.
+
+    The limit grows by one after `limit` successes in a row (about once
+    per round trip) while smoothed latency stays within `tolerance` times
+    the best latency seen. A 429/5xx, timeout or connection error
+    multiplies it by `backoff`, at most once per round of requests
+    started before the previous cut.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int,
+                 tolerance: float = 2.0, backoff: float = 0.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = min(max(initial, minimum), maximum)
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.inflight = 0
+        self.waiters = deque()
+        self.successes = 0
+        self.best = float('inf')
+        self.smoothed = None
+        self.last_decrease = 0.0
+        self.decreases = 0
+        self.peak = self.limit
+
+    async def acquire(self) -> float:
+        if self.inflight < self.limit and not self.waiters:
+            self.inflight += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if not waiter.cancelled():
+                    # woken and cancelled in the same step: free the slot
+                    self.inflight -= 1
+                    self.wake()
+                raise
+        return time.monotonic()
+
+    def release(self, start: float, outcome: str) -> None:
+        """`outcome` is 'ok', 'overload' or 'neutral'."""
+        self.inflight -= 1
+        if outcome == 'overload':
+            self.decrease(start)
+        elif outcome == 'ok':
+            self.observe(time.monotonic() - start)
+        self.wake()
+
+    def decrease(self, start: float) -> None:
+        if start < self.last_decrease:
+            return
+        self.limit = max(self.minimum, int(self.limit * self.backoff))
+        self.successes = 0
+        self.last_decrease = time.monotonic()
+        self.decreases += 1
+
+    def observe(self, latency: float) -> None:
+        self.best = min(self.best, latency)
+        if self.smoothed is None:
+            self.smoothed = latency
+        else:
+            self.smoothed = 0.9 * self.smoothed + 0.1 * latency
+        if self.smoothed > self.tolerance * self.best:
+            self.successes = 0
+            return
+        self.successes += 1
+        if self.successes >= self.limit and self.limit < self.maximum:
+            self.limit += 1
+            self.successes = 0
+            self.peak = max(self.peak, self.limit)
+
+    def wake(self) -> None:
+        while self.waiters and self.inflight < self.limit:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.inflight += 1
+                waiter.set_result(None)
+
+    def __str__(self):
+        return (
+            f'limiter limit={self.limit} peak={self.peak} '
+            f'decreases={self.decreases}'
+        )
@@ -0,0 +1,50 @@
+class Manifest:
+    """Append-only record of finished pages and images.
+
+    Each line is `page <item>/<number>` or `image <url>`. Lines are short
+    and written with a single O_APPEND write, so every worker process can
+    append to the same file. Without `track` the in-memory sets only
+    hold what load() read, so a long-running worker does not grow them.
+    """
+
+    def __init__(self, path: str, track: bool = True):
+        self.path = path
+        self.track = track
+        self.pages = set()
+        self.images = set()
+        self.file = None
+
+    def load(self) -> 'Manifest':
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    kind, _, key = line.rstrip('\n').partition(' ')
+                    if kind == 'page':
+                        self.pages.add(key)
+                    elif kind == 'image':
+                        self.images.add(key)
+        except FileNotFoundError:
+            pass
+        return self
+
+    def reset(self) -> None:
+        with open(self.path, 'w'):
+            pass
+
+    def open(self) -> None:
+        self.file = open(self.path, 'a', buffering=1)
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def add_page(self, key: str) -> None:
+        if self.track:
+            self.pages.add(key)
+        self.file.write(f'page {key}\n')
+
+    def add_image(self, url: str) -> None:
+        if self.track:
+            self.images.add(url)
+        self.file.write(f'image {url}\n')
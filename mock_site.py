@@ -0,0 +1,158 @@
+"""Local stand-in for stockfreeimages.com used by the benchmarks.
+
+Listing pages live at /p<n>/<item>.html and have the same shape the
+scraper parses (`img/@src` and `li.pag-text`). Images are synthetic
+bytes served from /img/<item>/<name>.jpg. /_stats has the wall-clock
+time of the first page and image request since the last /_stats/reset.
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import time
+
+from aiohttp import web
+from loguru import logger
+
+
+class MockSite:
+
+    def __init__(self, pages: int, images_per_page: int, image_size: int,
+                 latency: float, bandwidth: int, error_rate: float,
+                 seed: int = 0):
+        self.pages = pages
+        self.images_per_page = images_per_page
+        self.image_size = image_size
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.first = {'page': None, 'image': None}
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get(r'/p{page:\d+}/{item}.html', self.listing)
+        app.router.add_get('/img/{item}/{name}', self.image)
+        app.router.add_get('/_stats', self.stats)
+        app.router.add_post('/_stats/reset', self.reset)
+        return app
+
+    def seen(self, kind: str) -> None:
+        if self.first[kind] is None:
+            self.first[kind] = time.time()
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.first)
+
+    async def reset(self, request: web.Request) -> web.Response:
+        self.first = dict.fromkeys(self.first)
+        return web.json_response(self.first)
+
+    async def delay(self) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def failed(self):
+        if self.error_rate and self.random.random() < self.error_rate:
+            return web.Response(status=503, headers={'Retry-After': '1'})
+        return None
+
+    async def listing(self, request: web.Request) -> web.Response:
+        self.seen('page')
+        await self.delay()
+        error = self.failed()
+        if error is not None:
+            return error
+        page = int(request.match_info['page'])
+        item = request.match_info['item']
+        if page > self.pages:
+            raise web.HTTPNotFound()
+        host = f'http://{request.host}'
+        images = '\n'.join(
+            f'<li><a href="#"><img src="{host}/img/{item}/{page}-{i}.jpg">'
+            f'</a></li>'
+            for i in range(self.images_per_page)
+        )
+        body = (
+            f'<html><head><title>{item}</title></head><body>'
+            f'<img src="{host}/static/logo.png">'
+            f'<ul class="grid">\n{images}\n</ul>'
+            f'<ul class="pagination"><li class="pag-text">'
+            f'of {self.pages} pages</li></ul>'
+            f'</body></html>'
+        )
+        return web.Response(text=body, content_type='text/html')
+
+    async def image(self, request: web.Request) -> web.StreamResponse:
+        self.seen('image')
+        await self.delay()
+        error = self.failed()
+        if error is not None:
+            return error
+        name = request.match_info['name']
+        etag = '"' + hashlib.sha1(name.encode()).hexdigest() + '"'
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+        response = web.StreamResponse(headers={
+            'Content-Type': 'image/jpeg',
+            'Content-Length': str(self.image_size),
+            'ETag': etag,
+        })
+        await response.prepare(request)
+        block = hashlib.sha256(name.encode()).digest() * 2048
+        chunk_size = len(block)
+        if self.bandwidth:
+            chunk_size = min(chunk_size, max(self.bandwidth // 10, 1))
+        sent = 0
+        while sent < self.image_size:
+            chunk = block[:min(chunk_size, self.image_size - sent)]
+            await response.write(chunk)
+            sent += len(chunk)
+            if self.bandwidth:
+                await asyncio.sleep(len(chunk) / self.bandwidth)
+        await response.write_eof()
+        return response
+
+
+def parse_cli_args():
+    mparser = argparse.ArgumentParser(
+        description='Serve a local mock image site')
+    mparser.add_argument('--host', default='127.0.0.1', help='bind address')
+    mparser.add_argument('--port', type=int, default=8080, help='bind port')
+    mparser.add_argument('--pages',
+                         type=int,
+                         default=20,
+                         help='listing pages per category')
+    mparser.add_argument('--images-per-page',
+                         type=int,
+                         default=30,
+                         help='images on each listing page')
+    mparser.add_argument('--image-size',
+                         type=int,
+                         default=64 * 1024,
+                         help='bytes per image')
+    mparser.add_argument('--latency',
+                         type=float,
+                         default=0.05,
+                         help='seconds before every response')
+    mparser.add_argument('--bandwidth',
+                         type=int,
+                         default=0,
+                         help='bytes per second per image, 0 is unlimited')
+    mparser.add_argument('--error-rate',
+                         type=float,
+                         default=0.0,
+                         help='share of requests answered with 503')
+    return mparser.parse_args()
+
+
+def main():
+    args = parse_cli_args()
+    site = MockSite(args.pages, args.images_per_page, args.image_size,
+                    args.latency, args.bandwidth, args.error_rate)
+    logger.info(f'Mock site on http://{args.host}:{args.port}/')
+    web.run_app(site.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
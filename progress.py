@@ -0,0 +1,90 @@
+import os
+import time
+from multiprocessing import shared_memory
+
+from loguru import logger
+
+PAGES, IMAGES, BYTES, FAILURES, INFLIGHT = range(5)
+FIELDS = ('pages', 'images', 'bytes', 'failures', 'inflight')
+
+
+class Progress:
+    """Per-worker int64 counters in a SharedMemory block.
+
+    Each worker only writes its own row, so no locks are needed; main
+    reads all rows to report live progress without any queue traffic.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=max(workers, 1) * len(FIELDS) * 8
+        )
+        self.name = self.shm.name
+        self.owner = os.getpid()
+        self.counters = self.shm.buf.cast('q')
+        for index in range(len(self.counters)):
+            self.counters[index] = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['shm'] = None
+        state['counters'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.shm = shared_memory.SharedMemory(name=self.name)
+        self.counters = self.shm.buf.cast('q')
+
+    def row(self, worker: int) -> memoryview:
+        start = worker * len(FIELDS)
+        return self.counters[start:start + len(FIELDS)]
+
+    def totals(self) -> list:
+        totals = [0] * len(FIELDS)
+        for worker in range(self.workers):
+            for field, value in enumerate(self.row(worker)):
+                totals[field] += value
+        return totals
+
+    def close(self, row: memoryview = None) -> None:
+        """Release `row` if given, detach, and unlink in the creator."""
+        if row is not None:
+            row.release()
+        self.counters.release()
+        self.shm.close()
+        if self.owner == os.getpid():
+            self.shm.unlink()
+
+
+class ProgressReport:
+    """Logs throughput and ETA from Progress totals when called."""
+
+    def __init__(self, progress: Progress, total_pages: int):
+        self.progress = progress
+        self.total_pages = total_pages
+        self.started = self.last = time.monotonic()
+        self.last_totals = [0] * len(FIELDS)
+
+    def __call__(self) -> None:
+        now = time.monotonic()
+        totals = self.progress.totals()
+        elapsed = max(now - self.last, 1e-9)
+        images_rate = (totals[IMAGES] - self.last_totals[IMAGES]) / elapsed
+        bytes_rate = (totals[BYTES] - self.last_totals[BYTES]) / elapsed
+        pages = totals[PAGES]
+        if pages:
+            eta = (self.total_pages - pages) * (now - self.started) / pages
+            eta = f'{eta:.0f}s'
+        else:
+            eta = '?'
+        logger.info(
+            f'Progress: pages {pages}/{self.total_pages}, '
+            f'images {totals[IMAGES]} ({images_rate:.1f}/s), '
+            f'{bytes_rate / 2 ** 20:.2f}MB/s, '
+            f'failures {totals[FAILURES]}, in flight {totals[INFLIGHT]}, '
+            f'ETA {eta}'
+        )
+        self.last = now
+        self.last_totals = totals
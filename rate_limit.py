@@ -0,0 +1,90 @@
+import asyncio
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+
+KINDS = ('page', 'image')
+
+
+class SharedTokenBucket:
+    """Token buckets shared by all worker processes, one per request kind.
+
+    Each bucket is a (tokens, last refill) pair of doubles in a
+    SharedMemory block, updated under one process-shared lock. A caller
+    takes a token even when the bucket is empty and sleeps off the debt,
+    so waiting callers are served in the order they arrived.
+    A rate of 0 leaves that kind unlimited.
+    """
+
+    def __init__(self, rates: dict, burst: float):
+        self.rates = rates
+        self.burst = burst
+        self.lock = multiprocessing.Lock()
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=len(KINDS) * 2 * 8
+        )
+        self.name = self.shm.name
+        self.owner = True
+        buckets = self.shm.buf.cast('d')
+        now = time.monotonic()
+        for index in range(len(KINDS)):
+            buckets[index * 2] = burst
+            buckets[index * 2 + 1] = now
+        buckets.release()
+
+    @classmethod
+    def from_config(cls, rate_limit: dict, pages: float = None,
+                    images: float = None) -> 'SharedTokenBucket':
+        rates = {
+            'page': rate_limit['PAGES'] if pages is None else pages,
+            'image': rate_limit['IMAGES'] if images is None else images,
+        }
+        return cls(rates, rate_limit['BURST'])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['shm'] = None
+        state['owner'] = False
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.shm = shared_memory.SharedMemory(name=self.name)
+
+    def reserve(self, kind: str) -> float:
+        """Take a token of `kind`; return how long to wait before using it."""
+        rate = self.rates[kind]
+        if not rate:
+            return 0.0
+        index = KINDS.index(kind) * 2
+        with self.lock:
+            buckets = self.shm.buf.cast('d')
+            now = time.monotonic()
+            tokens = min(
+                self.burst,
+                buckets[index] + (now - buckets[index + 1]) * rate
+            )
+            buckets[index] = tokens - 1
+            buckets[index + 1] = now
+            buckets.release()
+        return max(0.0, (1 - tokens) / rate)
+
+    async def acquire(self, kind: str) -> None:
+        delay = self.reserve(kind)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def wait(self, kind: str) -> None:
+        delay = self.reserve(kind)
+        if delay:
+            time.sleep(delay)
+
+    def close(self) -> None:
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __str__(self):
+        return ', '.join(
+            f'{kind} rate={self.rates[kind] or "unlimited"}' for kind in KINDS
+        )
@@ -0,0 +1,132 @@
+import queue
+import time
+import zlib
+from collections import Counter
+from typing import NamedTuple
+
+SUCCEEDED, CACHED, SKIPPED, FAILED, PAGE_FAILED, PAGE_DONE = range(6)
+STATUSES = ('succeeded', 'cached', 'skipped', 'failed', 'page failed',
+            'page done')
+
+
+class Result(NamedTuple):
+    status: int
+    size: int
+    latency: float
+    url_id: int
+    job: int = 0
+
+
+def url_id(url: str) -> int:
+    return zlib.crc32(url.encode())
+
+
+class ResultBatch:
+    """Collects a worker's results and sends them as one list per batch."""
+
+    def __init__(self, result_queue, name: str, size: int):
+        self.result_queue = result_queue
+        self.name = name
+        self.size = size
+        self.results = []
+
+    def add(self, status: int, url: str, size: int = 0,
+            latency: float = 0.0, job: int = 0) -> None:
+        self.results.append(Result(status, size, latency, url_id(url), job))
+        if len(self.results) >= self.size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.results:
+            self.result_queue.put(('results', self.results))
+            self.results = []
+
+    def close(self, crashed: bool = False) -> None:
+        """Flush and send ('done', (name, crashed))."""
+        self.flush()
+        self.result_queue.put(('done', (self.name, crashed)))
+
+
+class Summary:
+    """Exact totals over every result batch the workers sent."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.bytes = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.crashed = []
+
+    def add(self, results: list) -> None:
+        for result in results:
+            self.counts[result.status] += 1
+            self.bytes += result.size
+            if result.status == SUCCEEDED:
+                self.latency += result.latency
+                self.max_latency = max(self.max_latency, result.latency)
+
+    def collect(self, result_queue, workers: list, tick=None,
+                interval: float = 0) -> None:
+        """Read batches until every worker process is done, calling `tick`
+        at most every `interval` seconds in between.
+
+        A worker killed before sending 'done' ends the wait once every
+        process has exited and the queue is empty.
+        """
+        timeout = interval if tick is not None and interval else 1.0
+        next_tick = time.monotonic() + timeout
+        remaining = len(workers)
+        while remaining:
+            try:
+                kind, payload = result_queue.get(timeout=timeout)
+            except queue.Empty:
+                if all(worker.exitcode is not None for worker in workers):
+                    return
+                kind, payload = None, None
+            if kind == 'results':
+                self.add(payload)
+            elif kind == 'done':
+                remaining -= 1
+                name, crashed = payload
+                if crashed:
+                    self.crashed.append(name)
+            if tick is not None and time.monotonic() >= next_tick:
+                tick()
+                next_tick = time.monotonic() + timeout
+
+    def report(self, elapsed: float, **run) -> dict:
+        downloaded = self.counts[SUCCEEDED]
+        return {
+            **run,
+            **{name.replace(' ', '_'): self.counts[status]
+               for status, name in enumerate(STATUSES)},
+            'images': self.images,
+            'bytes': self.bytes,
+            'elapsed': elapsed,
+            'images_per_second': self.images / elapsed,
+            'mb_per_second': self.bytes / 2 ** 20 / elapsed,
+            'latency_avg': self.latency / downloaded if downloaded else 0.0,
+            'latency_max': self.max_latency,
+        }
+
+    @property
+    def images(self) -> int:
+        return sum(self.counts[status] for status in range(PAGE_FAILED))
+
+    @property
+    def pages(self) -> int:
+        return self.counts[PAGE_DONE] + self.counts[PAGE_FAILED]
+
+    def __str__(self):
+        downloaded = self.counts[SUCCEEDED]
+        average = self.latency / downloaded if downloaded else 0.0
+        counts = ', '.join(
+            f'{name}: {self.counts[status]}/{self.images}'
+            for status, name in enumerate(STATUSES[:PAGE_FAILED])
+        )
+        return (
+            f'{counts}, pages failed: {self.counts[PAGE_FAILED]}, '
+            f'{self.bytes / 2 ** 20:.1f}MB, '
+            f'latency avg={average * 1000:.0f}ms '
+            f'max={self.max_latency * 1000:.0f}ms'
+        )
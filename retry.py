@@ -0,0 +1,107 @@
+import multiprocessing
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+class RetryableStatus(Exception):
+
+    def __init__(self, status: int, retry_after: float = None):
+        super().__init__(f'status={status}')
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: str):
+    """Seconds to wait from a Retry-After header, None if absent/invalid."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class RetryPolicy:
+
+    def __init__(self, attempts: int, base: float, cap: float,
+                 jitter: bool, statuses):
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.jitter = jitter
+        self.statuses = frozenset(statuses)
+
+    @classmethod
+    def from_config(cls, retry: dict, attempts: int = None) -> 'RetryPolicy':
+        return cls(
+            attempts if attempts is not None else retry['ATTEMPTS'],
+            retry['BASE'],
+            retry['CAP'],
+            retry['JITTER'],
+            retry['STATUSES'],
+        )
+
+    def retryable(self, status: int) -> bool:
+        return status in self.statuses
+
+    def delay(self, attempt: int, retry_after: float = None) -> float:
+        backoff = min(self.cap, self.base * 2 ** attempt)
+        if self.jitter:
+            backoff = random.uniform(0, backoff)
+        if retry_after is not None:
+            backoff = max(backoff, min(retry_after, self.cap))
+        return backoff
+
+
+class RetryBudget:
+    """Retry tokens shared by all worker processes.
+
+    The budget starts full at `reserve` tokens, which is also its cap.
+    Every request deposits `ratio` tokens and every retry spends one, so
+    retries stay near `ratio` of the traffic once the reserve is used up.
+    """
+
+    TOKENS, RETRIES, DENIED, GAVE_UP = range(4)
+
+    def __init__(self, ratio: float, reserve: float):
+        self.ratio = ratio
+        self.reserve = reserve
+        self.counters = multiprocessing.Array('d', [reserve, 0, 0, 0])
+
+    @classmethod
+    def from_config(cls, retry: dict) -> 'RetryBudget':
+        return cls(retry['BUDGET_RATIO'], retry['BUDGET_MAX'])
+
+    def deposit(self) -> None:
+        with self.counters.get_lock():
+            self.counters[self.TOKENS] = min(
+                self.counters[self.TOKENS] + self.ratio, self.reserve
+            )
+
+    def withdraw(self) -> bool:
+        with self.counters.get_lock():
+            if self.counters[self.TOKENS] < 1:
+                self.counters[self.DENIED] += 1
+                return False
+            self.counters[self.TOKENS] -= 1
+            self.counters[self.RETRIES] += 1
+            return True
+
+    def gave_up(self) -> None:
+        with self.counters.get_lock():
+            self.counters[self.GAVE_UP] += 1
+
+    def __str__(self):
+        return (
+            f'retries: {int(self.counters[self.RETRIES])}, '
+            f'denied by budget: {int(self.counters[self.DENIED])}, '
+            f'gave up: {int(self.counters[self.GAVE_UP])}'
+        )
@@ -0,0 +1,137 @@
+"""Daemon mode: crawl jobs for a warm worker pool over a Unix socket.
+
+A client sends one JSON line, e.g. `{"items": ["cats"], "pages": 5}`.
+The server answers `{"job": <id>, "queued": <pages>}` once the job's
+pages are queued, then `{"job": <id>, "report": {...}}` once the last
+of them is in.
+"""
+import itertools
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+import time
+from collections import defaultdict
+
+from loguru import logger
+
+from results import Summary
+
+
+class Job:
+
+    def __init__(self, job_id: int, pages: int):
+        self.id = job_id
+        self.pages = pages
+        self.summary = Summary()
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.finished = threading.Event()
+        self.check()
+
+    def add(self, results: list) -> None:
+        self.summary.add(results)
+        self.check()
+
+    def check(self) -> None:
+        if self.summary.pages >= self.pages and not self.finished.is_set():
+            self.elapsed = time.perf_counter() - self.started
+            self.finished.set()
+
+    def report(self) -> dict:
+        return self.summary.report(
+            max(self.elapsed, 1e-9), job=self.id, pages=self.pages
+        )
+
+
+class JobBoard:
+    """Open jobs by id; result batches from the workers are split here."""
+
+    def __init__(self):
+        self.jobs = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def next_id(self) -> int:
+        with self.lock:
+            return next(self.ids)
+
+    def open(self, job_id: int, pages: int) -> Job:
+        job = Job(job_id, pages)
+        if not job.finished.is_set():
+            with self.lock:
+                self.jobs[job_id] = job
+        return job
+
+    def route(self, results: list) -> None:
+        by_job = defaultdict(list)
+        for result in results:
+            by_job[result.job].append(result)
+        with self.lock:
+            for job_id, batch in by_job.items():
+                job = self.jobs.get(job_id)
+                if job is None:
+                    continue
+                job.add(batch)
+                if job.finished.is_set():
+                    del self.jobs[job_id]
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+
+    def handle(self) -> None:
+        try:
+            job = self.server.admit(json.loads(self.rfile.readline()))
+        except Exception as exc:
+            logger.error(f'Job rejected, {exc!r}')
+            self.reply({'error': repr(exc)})
+            return
+        self.reply({'job': job.id, 'queued': job.pages})
+        while not job.finished.wait(1):
+            if not self.server.alive():
+                logger.error(f'Job {job.id} lost, a worker died')
+                self.reply({'job': job.id, 'error': 'a worker died'})
+                return
+        logger.info(f'Job {job.id} done, {job.summary}')
+        self.reply({'job': job.id, 'report': job.report()})
+
+    def reply(self, message: dict) -> None:
+        self.wfile.write(json.dumps(message).encode() + b'\n')
+
+
+class JobServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Admits every connection on its own thread; `admit(request)` queues
+    the job and returns its Job, `alive()` is False once a worker died.
+    server_close waits for the handlers still replying."""
+
+    daemon_threads = False
+    block_on_close = True
+
+    def __init__(self, path: str, admit, alive):
+        self.admit = admit
+        self.alive = alive
+        try:
+            if stat.S_ISSOCK(os.stat(path).st_mode):
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+        super().__init__(path, JobHandler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            os.remove(self.server_address)
+        except FileNotFoundError:
+            pass
+
+
+def submit(path: str, request: dict):
+    """Send a job to the daemon at `path`, yielding its replies."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(request).encode() + b'\n')
+        with sock.makefile() as replies:
+            for line in replies:
+                yield json.loads(line)
@@ -1,15 +1,38 @@
 import pathlib
-
-import yaml
+from collections.abc import Mapping
 
 BASE_DIR = pathlib.Path(__file__).parent.parent
-config_path = 'settings.yaml'
+config_path = pathlib.Path(__file__).parent / 'settings.yaml'
 
 
 def get_config(path):
+    import yaml
+
     with open(path) as f:
         config = yaml.safe_load(f)
     return config
 
 
-config = get_config(config_path)
+class LazyConfig(Mapping):
+    """settings.yaml, read on first access instead of at import."""
+
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+
+    def load(self) -> dict:
+        if self.data is None:
+            self.data = get_config(self.path)
+        return self.data
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+
+config = LazyConfig(config_path)
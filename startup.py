@@ -0,0 +1,60 @@
+"""Import cost of the entry point, per mode, from `python -X importtime`.
+
+Every target is imported in a fresh interpreter; the per-module lines
+are summed by top-level package and the most expensive are printed.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import Counter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# What a worker of each mode imports on top of the entry point.
+TARGETS = {
+    'cli': 'import image_scraper',
+    'sync': 'import image_scraper, requests',
+    'async': 'import image_scraper, aiohttp',
+    'xpath': 'import image_scraper, lxml.etree',
+}
+
+
+def import_times(code: str) -> Counter:
+    """Self time in microseconds per top-level package."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=HERE, capture_output=True, text=True, check=True
+    )
+    times = Counter()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if not fields[0].strip().isdigit():
+            continue  # the header line
+        package = fields[2].strip().split('.')[0]
+        times[package] += int(fields[0])
+    return times
+
+
+def parse_cli_args():
+    mparser = argparse.ArgumentParser(
+        description='Report import time of image_scraper per mode')
+    mparser.add_argument('--targets',
+                         default=','.join(TARGETS),
+                         help='comma separated of: ' + ', '.join(TARGETS))
+    mparser.add_argument('--top', type=int, default=8)
+    return mparser.parse_args()
+
+
+def main():
+    args = parse_cli_args()
+    for target in args.targets.split(','):
+        times = import_times(TARGETS[target])
+        print(f'{target}: {sum(times.values()) / 1000:.1f}ms')
+        for package, micros in times.most_common(args.top):
+            print(f'  {package:<24} {micros / 1000:8.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+import hashlib
+import itertools
+import os
+import threading
+from concurrent.futures import Future
+
+
+def shard_parts(digest: str, levels: int, width: int) -> list:
+    """['ab', 'cd'] for levels=2, width=2 and a digest starting abcd."""
+    return [digest[i * width:(i + 1) * width] for i in range(levels)]
+
+
+def shard_path(root: str, name: str, levels: int, width: int) -> str:
+    return os.path.join(root, *shard_parts(name, levels, width), name)
+
+
+class ShardDirs:
+    """Shard directories this process has made.
+
+    A shard is created the first time a file of this process lands in
+    it, so each worker does one mkdir per shard it uses, none per file.
+    """
+
+    def __init__(self):
+        self.made = set()
+
+    def ensure(self, path: str) -> str:
+        directory = os.path.dirname(path)
+        if directory not in self.made:
+            os.makedirs(directory, exist_ok=True)
+            self.made.add(directory)
+        return path
+
+
+class Layout:
+    """Path of a URL's image under OUT_DIR.
+
+    Flat (levels=0) keeps the URL basename directly in OUT_DIR; sharded
+    puts it under hash-prefix directories of the basename so no single
+    directory grows to millions of entries.
+    """
+
+    def __init__(self, root: str, levels: int = 0, width: int = 2):
+        self.root = root
+        self.levels = levels
+        self.width = width
+        self.dirs = ShardDirs()
+
+    def path(self, url: str) -> str:
+        name = url.split('/')[-1]
+        if not self.levels:
+            return os.path.join(self.root, name)
+        digest = hashlib.md5(name.encode()).hexdigest()
+        return self.dirs.ensure(os.path.join(
+            self.root, *shard_parts(digest, self.levels, self.width), name
+        ))
+
+    def create(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+
+
+class ContentStore:
+    """Images stored once per content hash, sharded into subdirectories.
+
+    A download is hashed while it streams. Bodies up to `buffer` bytes
+    stay in memory until the hash is known, so a duplicate is never
+    written; larger ones spill to a temp file that is dropped instead
+    of committed. `index` maps every URL stored to its digest.
+
+    A digest is claimed by its first writer; later copies wait on the
+    claim and only count as duplicates once the object is committed.
+    """
+
+    def __init__(self, root: str, levels: int, width: int, buffer: int):
+        self.root = root
+        self.objects = os.path.join(root, 'objects')
+        self.tmp = os.path.join(root, 'tmp')
+        self.levels = levels
+        self.width = width
+        self.buffer = buffer
+        self.index = {}
+        self.known = set()
+        self.writing = {}
+        self.duplicates = 0
+        self.index_file = None
+        self.temp_names = itertools.count()
+        self.lock = threading.Lock()
+        self.dirs = ShardDirs()
+
+    def create(self) -> None:
+        os.makedirs(self.objects, exist_ok=True)
+
+    def open(self) -> None:
+        os.makedirs(self.tmp, exist_ok=True)
+        index_path = os.path.join(self.root, 'index')
+        try:
+            with open(index_path) as f:
+                for line in f:
+                    digest, _, url = line.rstrip('\n').partition(' ')
+                    self.index[url] = digest
+        except FileNotFoundError:
+            pass
+        self.index_file = open(index_path, 'a', buffering=1)
+
+    def close(self) -> None:
+        if self.index_file is not None:
+            self.index_file.close()
+            self.index_file = None
+
+    @staticmethod
+    def hasher():
+        return hashlib.sha256()
+
+    def object_path(self, digest: str) -> str:
+        return shard_path(self.objects, digest, self.levels, self.width)
+
+    def path_for_url(self, url: str):
+        digest = self.index.get(url)
+        return None if digest is None else self.object_path(digest)
+
+    def temp_path(self) -> str:
+        return os.path.join(
+            self.tmp, f'{os.getpid()}-{next(self.temp_names)}.part'
+        )
+
+    def claim(self, digest: str):
+        """None if the caller is to write `digest`, else a future that
+        resolves to True once the object is stored, False if its writer
+        gave up."""
+        with self.lock:
+            first = self.writing.get(digest)
+            if first is not None:
+                return first
+            if digest not in self.known and not os.path.exists(
+                    self.object_path(digest)
+            ):
+                self.writing[digest] = Future()
+                return None
+            self.known.add(digest)
+        first = Future()
+        first.set_result(True)
+        return first
+
+    def stored(self, digest: str, url: str) -> None:
+        """The claimed object is committed; record `url` -> `digest`."""
+        with self.lock:
+            self.record(digest, url)
+            first = self.writing.pop(digest, None)
+        if first is not None:
+            first.set_result(True)
+
+    def abandon(self, digest: str) -> None:
+        """Drop the claim on `digest`; a waiting copy may write it."""
+        with self.lock:
+            first = self.writing.pop(digest, None)
+        if first is not None:
+            first.set_result(False)
+
+    def duplicate(self, digest: str, url: str) -> None:
+        with self.lock:
+            self.record(digest, url)
+            self.duplicates += 1
+
+    def record(self, digest: str, url: str) -> None:
+        if self.index.get(url) != digest:
+            self.index_file.write(f'{digest} {url}\n')
+            self.index[url] = digest
+        self.known.add(digest)
+
+    def commit(self, tmp_path: str, digest: str) -> None:
+        path = self.object_path(digest)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            return
+        os.replace(tmp_path, self.dirs.ensure(path))
+
+    def __str__(self):
+        return f'content store duplicates={self.duplicates}'
@@ -0,0 +1,189 @@
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+FSYNC = ('never', 'file', 'end')
+
+
+class WriteJob:
+    __slots__ = ('path', 'queue', 'fd', 'size', 'error')
+
+    def __init__(self, path: str, jobs: queue.SimpleQueue):
+        self.path = path
+        self.queue = jobs
+        self.fd = None
+        self.size = 0
+        self.error = None
+
+
+class FileWriter:
+    """Writes files with plain os calls from a small pool of threads.
+
+    Every open, write and close is queued; a thread drains up to `batch`
+    queued operations per wake-up, so many small files share one hop.
+    All operations on a path go to the same thread, so chunks stay ordered
+    and an aborted attempt can never remove the file a retry wrote.
+    """
+
+    def __init__(self, threads: int = 2, batch: int = 64,
+                 fsync: str = 'never'):
+        if fsync not in FSYNC:
+            raise ValueError(f'fsync must be one of {FSYNC}')
+        self.batch = batch
+        self.fsync = fsync
+        self.queues = [queue.SimpleQueue() for _ in range(threads)]
+        self.threads = [
+            threading.Thread(target=self.drain, args=(jobs,), daemon=True)
+            for jobs in self.queues
+        ]
+        self.lock = threading.Lock()
+        self.files = 0
+        self.bytes = 0
+        self.hops = 0
+        self.busy = 0.0
+
+    def start(self) -> None:
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self) -> None:
+        for jobs in self.queues:
+            jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.fsync == 'end':
+            os.sync()
+
+    def open(self, path: str) -> WriteJob:
+        job = WriteJob(path, self.queues[hash(path) % len(self.queues)])
+        job.queue.put(('open', job, None))
+        return job
+
+    def write(self, job: WriteJob, chunk: bytes, done=None) -> None:
+        """Queue a chunk; `done(n)` is called once per batch with the
+        number of this caller's chunks that were written."""
+        job.queue.put(('write', job, (chunk, done)))
+
+    def close(self, job: WriteJob, finish=None) -> Future:
+        """Queue the close; the future resolves to the file size.
+
+        `finish(path)` runs on the writer thread once the file is closed,
+        e.g. to move it into place.
+        """
+        future = Future()
+        job.queue.put(('close', job, (future, finish)))
+        return future
+
+    def abort(self, job: WriteJob) -> None:
+        job.queue.put(('abort', job, None))
+
+    def drain(self, jobs: queue.SimpleQueue) -> None:
+        while True:
+            ops = [jobs.get()]
+            while len(ops) < self.batch:
+                try:
+                    ops.append(jobs.get_nowait())
+                except queue.Empty:
+                    break
+            start = time.perf_counter()
+            done = Counter()
+            files = size = 0
+            for op in ops:
+                if op is None:
+                    self.account(start, files, size)
+                    self.notify(done)
+                    return
+                action, job, arg = op
+                if action == 'write':
+                    chunk, callback = arg
+                    size += self.write_chunk(job, chunk)
+                    if callback is not None:
+                        done[callback] += 1
+                elif action == 'open':
+                    self.open_file(job)
+                elif action == 'close':
+                    files += self.close_file(job, arg)
+                else:
+                    self.abort_file(job)
+            self.account(start, files, size)
+            self.notify(done)
+
+    @staticmethod
+    def notify(done: Counter) -> None:
+        for callback, count in done.items():
+            callback(count)
+
+    def account(self, start: float, files: int, size: int) -> None:
+        with self.lock:
+            self.busy += time.perf_counter() - start
+            self.hops += 1
+            self.files += files
+            self.bytes += size
+
+    @staticmethod
+    def open_file(job: WriteJob) -> None:
+        try:
+            job.fd = os.open(
+                job.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644
+            )
+        except OSError as exc:
+            job.error = exc
+
+    @staticmethod
+    def write_chunk(job: WriteJob, chunk: bytes) -> int:
+        if job.error is not None:
+            return 0
+        view = memoryview(chunk)
+        try:
+            while view:
+                view = view[os.write(job.fd, view):]
+        except OSError as exc:
+            job.error = exc
+            return 0
+        job.size += len(chunk)
+        return len(chunk)
+
+    def close_file(self, job: WriteJob, arg: tuple) -> int:
+        future, finish = arg
+        if job.fd is not None:
+            try:
+                if self.fsync == 'file' and job.error is None:
+                    os.fsync(job.fd)
+            except OSError as exc:
+                job.error = exc
+            finally:
+                os.close(job.fd)
+        if job.error is None and finish is not None:
+            try:
+                finish(job.path)
+            except OSError as exc:
+                job.error = exc
+        if job.error is not None:
+            self.remove(job.path)
+            future.set_exception(job.error)
+            return 0
+        future.set_result(job.size)
+        return 1
+
+    def abort_file(self, job: WriteJob) -> None:
+        if job.fd is not None:
+            os.close(job.fd)
+        self.remove(job.path)
+
+    @staticmethod
+    def remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def __str__(self):
+        busy = self.busy or 1e-9
+        return (
+            f'writer files={self.files} '
+            f'{self.bytes / busy / 2 ** 20:.1f}MB/s busy, '
+            f'{(self.files / self.hops) if self.hops else 0:.1f} files/hop'
+        )